@@ -0,0 +1,171 @@
+"""Admission control: per-route concurrency limits, priority queues and deadline-aware load shedding."""
+
+import asyncio
+import heapq
+import itertools
+import math
+from contextlib import asynccontextmanager
+
+# Header where clients can send how many seconds they are willing to wait for a response
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Weight of the last request in the moving average of the service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted, because its queue is full or it would miss its deadline."""
+
+
+class AdmissionQueue:
+    """
+    Limits the number of concurrent requests of a model family and queues the rest.
+
+    Queued requests are admitted by earliest deadline first, and requests without a deadline in arrival order. A
+    request is shed as soon as it is clear that it will not be served before its deadline: on arrival, if the expected
+    wait is longer than its timeout, or later, if its deadline expires while it is still queued.
+
+    Parameters
+    ----------
+    name:
+        str: Name of the queue.
+    max_concurrency:
+        int: Maximum number of requests served at the same time.
+    max_queue_size:
+        int: Maximum number of requests waiting to be served.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue_size: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+
+        self._in_flight = 0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._service_time: float | None = None
+
+        self.counters = {"admitted": 0, "completed": 0, "rejected_queue_full": 0, "shed_deadline": 0}
+
+    @property
+    def queued(self) -> int:
+        """Number of requests waiting to be served."""
+        return sum(not future.done() for _, _, future in self._waiters)
+
+    def expected_wait(self) -> float:
+        """Estimates how long a new request would wait before being served, in seconds."""
+        if self._in_flight < self.max_concurrency or self._service_time is None:
+            return 0.0
+        return self._service_time * (self.queued + 1) / self.max_concurrency
+
+    @asynccontextmanager
+    async def admit(self, timeout: float | None = None):
+        """
+        Waits for a free slot and holds it while the context is active.
+
+        Parameters
+        ----------
+        timeout:
+            float | None: Number of seconds the client is willing to wait. If `None`, the request never expires.
+
+        Raises
+        ------
+        AdmissionRejected: If the request is rejected or shed.
+        """
+        loop = asyncio.get_running_loop()
+        await self._acquire(timeout, loop)
+
+        self.counters["admitted"] += 1
+        start = loop.time()
+        try:
+            yield
+        finally:
+            elapsed = loop.time() - start
+            if self._service_time is None:
+                self._service_time = elapsed
+            else:
+                self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+
+            self.counters["completed"] += 1
+            self._release()
+
+    async def _acquire(self, timeout: float | None, loop: asyncio.AbstractEventLoop):
+        if timeout is not None and (timeout <= 0 or self.expected_wait() > timeout):
+            self.counters["shed_deadline"] += 1
+            raise AdmissionRejected(f"The {self.name} requests cannot be served within the requested timeout")
+
+        if self._in_flight < self.max_concurrency and not self.queued:
+            self._in_flight += 1
+            return
+
+        if self.queued >= self.max_queue_size:
+            self.counters["rejected_queue_full"] += 1
+            raise AdmissionRejected(f"Too many {self.name} requests")
+
+        deadline = math.inf if timeout is None else loop.time() + timeout
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (deadline, next(self._sequence), future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as exc:
+            # The slot may have been handed over right when the deadline expired
+            if future.done() and not future.cancelled():
+                self._release()
+            self.counters["shed_deadline"] += 1
+            raise AdmissionRejected(f"The {self.name} request expired while waiting to be served") from exc
+        except asyncio.CancelledError:
+            # The client went away right after being given a slot, so hand it over to the next request
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        """Hands the slot over to the queued request with the earliest deadline, or frees it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            # Skip the requests that expired or were cancelled while waiting
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self._in_flight -= 1
+
+    def stats(self) -> dict:
+        """Returns the counters and the current state of the queue."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self._in_flight,
+            "queued": self.queued,
+            "service_time_s": self._service_time,
+            **self.counters,
+        }
+
+
+class AdmissionController:
+    """
+    Routes each request to the admission queue of its model family.
+
+    Parameters
+    ----------
+    queues:
+        dict[str, AdmissionQueue]: The admission queue of each model family.
+    routes:
+        dict[str, str]: The model family of each route prefix. Requests to other routes are not limited.
+    """
+
+    def __init__(self, queues: dict[str, AdmissionQueue], routes: dict[str, str]):
+        self.queues = queues
+        self.routes = routes
+
+    def queue_for(self, path: str) -> AdmissionQueue | None:
+        """Returns the admission queue of a request path, if any."""
+        for prefix, family in self.routes.items():
+            if path.startswith(prefix):
+                return self.queues[family]
+        return None
+
+    def stats(self) -> dict:
+        """Returns the stats of every queue."""
+        return {family: queue.stats() for family, queue in self.queues.items()}
@@ -1,37 +1,52 @@
 """Main script: it includes our API initialization and endpoints."""
 
 import logging
+import math
 import pickle
+import time
 from contextlib import asynccontextmanager
 from http import HTTPStatus
 
+import numpy as np
 import tensorflow as tf
-import tensorflow_hub as hub
 from codecarbon import track_emissions
-from fastapi import FastAPI, HTTPException, UploadFile
-
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from PIL import Image, UnidentifiedImageError
+from sklearn.datasets import load_iris
+
+from src.app.admission import TIMEOUT_HEADER, AdmissionController, AdmissionQueue, AdmissionRejected
+from src.app.body_limit import BodySizeLimitMiddleware
 from src.app.schemas import IrisPredictionPayload, IrisType
-from src.config import METRICS_DIR, MODELS_DIR
+from src.app.shadow import ShadowEvaluator, parse_shadow_models
+from src.config import MAX_IMAGE_PIXELS, MAX_UPLOAD_BYTES, METRICS_DIR, MODELS_DIR, SHADOW_MODELS
+from src.features.image_pipeline import file_to_image, image_dimensions
+from src.models.image_models import IMAGE_MODEL_REGISTRY, load_image_model
+from src.models.imagenet_labels import decode_top_k, load_imagenet_labels
+from src.models.linear_scorer import verified_scorer
 
 # Initialize the dictionary to group models by "tabular" or "image" and then by model type
 model_wrappers_dict: dict[str, dict[str, dict]] = {"tabular": {}, "image": {}}
 
-
-def file_to_image(file: bytes):
-    """
-    Reads an image file and formats it for the model.
-
-    Parameters
-    ----------
-    file:
-        bytes: The image file to classify.
-
-    Returns
-    -------
-    Tensor: The image formatted for the model.
-    """
-    image = tf.io.decode_image(file, channels=3, dtype=tf.float32)
-    return tf.image.resize(image, [224, 224])
+# Shadow evaluator of each served tabular model that has a candidate model, by type of the served model
+shadow_evaluators: dict[str, ShadowEvaluator] = {}
+
+# Size allowed for the multipart boundaries and headers of an upload, on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 2**10
+
+# Cheap tabular predictions and expensive image predictions are admitted through separate queues, so a burst of image
+# uploads cannot starve the tabular requests. The tabular requests are admitted by the `_admission_control` middleware,
+# while the image endpoint only admits the classification, once the upload has been received
+admission_controller = AdmissionController(
+    queues={
+        "tabular": AdmissionQueue("tabular", max_concurrency=16, max_queue_size=256),
+        "image": AdmissionQueue("image", max_concurrency=2, max_queue_size=32),
+    },
+    routes={
+        "/predict/tabular": "tabular",
+    },
+)
 
 
 @asynccontextmanager
@@ -42,21 +57,51 @@ async def lifespan(app: FastAPI):
         filename for filename in MODELS_DIR.iterdir() if filename.suffix == ".pkl" and filename.stem.startswith("iris")
     ]
 
+    # Samples used to check that the NumPy scorers predict exactly like the scikit-learn models
+    iris_samples = load_iris().data
+
     for path in model_paths:
         with open(path, "rb") as file:
             model_wrapper = pickle.load(file)
-            model_wrappers_dict["tabular"][model_wrapper["type"]] = model_wrapper
 
-    cv_model = hub.KerasLayer(
-        "https://www.kaggle.com/models/google/mobilenet-v3/TensorFlow2/small-075-224-classification/1"
-    )
-    model_wrappers_dict["image"]["mobilenet_v3"] = {
-        "model": cv_model,
-        "type": "mobilenet_v3",
-    }
+        # Predict the linear models with a NumPy scorer, to skip scikit-learn's validation overhead
+        try:
+            model_wrapper["scorer"] = verified_scorer(model_wrapper["model"], iris_samples)
+        except ValueError as exc:
+            logging.warning("Predicting %s with scikit-learn: %s", model_wrapper["type"], exc)
+
+        model_wrappers_dict["tabular"][model_wrapper["type"]] = model_wrapper
+
+    # Start scoring the traffic of the served tabular models with their candidate models, if any
+    for primary_type, candidate_type in parse_shadow_models(SHADOW_MODELS).items():
+        tabular_models = model_wrappers_dict["tabular"]
+        if primary_type not in tabular_models or candidate_type not in tabular_models:
+            logging.warning("Shadow model %s or %s not found", candidate_type, primary_type)
+            continue
+        shadow_evaluators[primary_type] = ShadowEvaluator(primary_type, tabular_models[candidate_type])
+        shadow_evaluators[primary_type].start()
+
+    # Load the ImageNet class names once, so predictions are decoded without reading the Keras class index
+    imagenet_labels = load_imagenet_labels()
+
+    # Load every image model of the registry, skipping the reduced-precision ones that have not been exported
+    for model_type, model_info in IMAGE_MODEL_REGISTRY.items():
+        cv_model = load_image_model(model_type)
+        if cv_model is None:
+            continue
+        model_wrappers_dict["image"][model_type] = {
+            "model": cv_model,
+            "type": model_type,
+            "precision": model_info["precision"],
+            "labels": imagenet_labels,
+        }
 
     yield
 
+    for shadow_evaluator in shadow_evaluators.values():
+        shadow_evaluator.stop()
+    shadow_evaluators.clear()
+
     # Clear the list of models to avoid memory leaks
     del model_wrappers_dict["tabular"]
     del model_wrappers_dict["image"]
@@ -70,6 +115,148 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Stop receiving an image upload as soon as it is too large, even if its size is not declared in `Content-Length`.
+# Starlette spools the whole multipart body before calling the endpoint, so this is what bounds the memory and disk
+# used by an upload. It is added first so it runs inside the other middlewares
+app.add_middleware(
+    BodySizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, path_prefix="/predict/image"
+)
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Reads an uploaded file, rejecting it if it is larger than `max_bytes`.
+
+    By the time the endpoint runs, Starlette has already spooled the multipart body, whose size is bounded by
+    `BodySizeLimitMiddleware`. This checks the size of the file itself, without the multipart overhead.
+
+    Parameters
+    ----------
+    file:
+        UploadFile: The uploaded file.
+    max_bytes:
+        int: The maximum size of the file.
+
+    Returns
+    -------
+    bytes: The contents of the file.
+
+    Raises
+    ------
+    HTTPException: If the file is larger than `max_bytes`.
+    """
+    too_large = HTTPException(
+        status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=f"File larger than {max_bytes} bytes"
+    )
+
+    # The multipart parser already knows the size of the file, so we can reject it without reading it
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    contents = await file.read()
+    if len(contents) > max_bytes:
+        raise too_large
+
+    return contents
+
+
+def classify_image(image_stream: bytes, model_wrapper: dict) -> tuple[tf.Tensor, str]:
+    """
+    Decodes an image and classifies it with an image model.
+
+    It is CPU-bound, so the endpoint runs it in the threadpool to keep the event loop free for the other requests.
+
+    Parameters
+    ----------
+    image_stream:
+        bytes: The encoded image.
+    model_wrapper:
+        dict: The wrapper of the image model.
+
+    Returns
+    -------
+    tuple[tf.Tensor, str]: The scores of the model and the name of the predicted class.
+    """
+    # Large JPEG images are decoded at a reduced resolution, since they are resized to 224x224 anyway
+    image = file_to_image(image_stream)
+
+    predictions = model_wrapper["model"](tf.expand_dims(image, axis=0))
+    # The first output of the model is the background class, which is not part of ImageNet
+    predicted_label = decode_top_k(np.asarray(predictions)[:, 1:], model_wrapper["labels"], k=1)[0][0][0]
+
+    return predictions, predicted_label
+
+
+def read_timeout(request: Request) -> float | None:
+    """
+    Reads the number of seconds the client is willing to wait, from the `X-Request-Timeout` header.
+
+    Parameters
+    ----------
+    request:
+        Request: The incoming request.
+
+    Returns
+    -------
+    float | None: The timeout, or `None` if the header is not set.
+
+    Raises
+    ------
+    ValueError: If the header is not a finite number.
+    """
+    timeout = request.headers.get(TIMEOUT_HEADER)
+    if timeout is None:
+        return None
+
+    timeout = float(timeout)
+    # `nan` and `inf` would break the ordering of the deadlines in the admission queue
+    if not math.isfinite(timeout):
+        raise ValueError(f"Invalid timeout {timeout}")
+    return timeout
+
+
+@app.middleware("http")
+async def _admission_control(request: Request, call_next):
+    """Limits the concurrent prediction requests and sheds the ones that cannot be served before their deadline."""
+
+    admission_queue = admission_controller.queue_for(request.url.path)
+    if admission_queue is None:
+        return await call_next(request)
+
+    try:
+        timeout = read_timeout(request)
+    except ValueError:
+        return JSONResponse(status_code=HTTPStatus.BAD_REQUEST, content={"detail": f"Invalid {TIMEOUT_HEADER} header"})
+
+    try:
+        async with admission_queue.admit(timeout):
+            return await call_next(request)
+    except AdmissionRejected as exc:
+        return JSONResponse(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            content={"detail": str(exc)},
+            headers={"Retry-After": "1"},
+        )
+
+
+@app.middleware("http")
+async def _limit_upload_size(request: Request, call_next):
+    """Rejects image uploads whose declared size is too large before their body is received."""
+
+    content_length = request.headers.get("content-length")
+    if (
+        request.url.path.startswith("/predict/image")
+        and content_length is not None
+        and content_length.isdigit()
+        and int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    ):
+        return JSONResponse(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            content={"detail": f"File larger than {MAX_UPLOAD_BYTES} bytes"},
+        )
+
+    return await call_next(request)
+
 
 @app.get("/", tags=["General"])  # path operation decorator
 async def _index():
@@ -83,6 +270,28 @@ async def _index():
     return response
 
 
+@app.get("/admission", tags=["General"])
+async def _get_admission_stats():
+    """Return the counters of the admission queues."""
+
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": admission_controller.stats(),
+    }
+
+
+@app.get("/shadow/tabular", tags=["General"])
+async def _get_shadow_stats():
+    """Return the agreement and latency of the candidate tabular models evaluated in shadow mode."""
+
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": {primary_type: evaluator.stats() for primary_type, evaluator in shadow_evaluators.items()},
+    }
+
+
 @app.get("/models/tabular", tags=["Prediction"])
 def _get_tabular_models_list(model_type: str | None = None):
     """Return the list of available models"""
@@ -139,8 +348,17 @@ def _predict_tabular(model_type: str, payload: IrisPredictionPayload):
     model_wrapper = model_wrappers_dict["tabular"].get(model_type, None)
 
     if model_wrapper:
-        prediction = model_wrapper["model"].predict(features)
-        prediction = int(prediction[0])
+        start = time.perf_counter()
+        if "scorer" in model_wrapper:
+            prediction = model_wrapper["scorer"].predict_one(features[0])
+        else:
+            prediction = model_wrapper["model"].predict(features)[0]
+        prediction = int(prediction)
+
+        # Hand the request over to the shadow evaluator, which never blocks the response
+        shadow_evaluator = shadow_evaluators.get(model_type)
+        if shadow_evaluator is not None:
+            shadow_evaluator.submit(features[0], prediction, time.perf_counter() - start)
         predicted_type = IrisType(prediction).name
 
         response = {
@@ -171,23 +389,57 @@ def _predict_tabular(model_type: str, payload: IrisPredictionPayload):
     output_dir=METRICS_DIR,
 )
 @app.post("/predict/image/", tags=["Prediction"])
-async def _predict_image(file: UploadFile):
+async def _predict_image(request: Request, file: UploadFile, model_type: str = "mobilenet_v3"):
     """
     Classifies ImageNet images using a pre-trained MobileNetV3 model.
 
     Parameters
     ----------
+    request : Request
+        The incoming request, whose `X-Request-Timeout` header bounds the wait for an image slot.
     file : UploadFile
         The image to classify.
+    model_type : str
+        The image model to use. Reduced-precision variants (e.g., `mobilenet_v3_int8`) are available once exported.
     """
-    # Read the image file and format it for the model
-    image_stream = await file.read()
-    image = file_to_image(image_stream)
-    await file.close()
+    model_wrapper = model_wrappers_dict["image"].get(model_type, None)
+    if model_wrapper is None:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Model not found")
 
-    cv_model = model_wrappers_dict["image"]["mobilenet_v3"]["model"]
-    predictions = cv_model(tf.expand_dims(image, axis=0))
-    predicted_label = tf.keras.applications.mobilenet_v3.decode_predictions(predictions[:, 1:], top=1)[0][0][1]
+    try:
+        timeout = read_timeout(request)
+    except ValueError as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"Invalid {TIMEOUT_HEADER} header") from exc
+
+    # Read the image file, up to `MAX_UPLOAD_BYTES`
+    try:
+        image_stream = await read_upload(file)
+    finally:
+        await file.close()
+
+    # Check the dimensions from the image header before decoding it
+    try:
+        height, width = image_dimensions(image_stream)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid image") from exc
+    if height * width > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=f"Image larger than {MAX_IMAGE_PIXELS} pixels"
+        )
+
+    # Only the CPU-bound classification holds an image slot, so slow uploads cannot keep the slots busy while the CPU is
+    # idle, and the upload time does not count as service time when estimating the wait of the next requests.
+    # The header of truncated images, or of formats that Pillow reads but TensorFlow does not (e.g., WebP or TIFF), is
+    # valid, so they only fail when they are decoded
+    try:
+        async with admission_controller.queues["image"].admit(timeout):
+            predictions, predicted_label = await run_in_threadpool(classify_image, image_stream, model_wrapper)
+    except AdmissionRejected as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail=str(exc), headers={"Retry-After": "1"}
+        ) from exc
+    except tf.errors.InvalidArgumentError as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid image") from exc
 
     logging.info("Predicted class %s", predicted_label)
 
@@ -195,7 +447,7 @@ async def _predict_image(file: UploadFile):
         "message": HTTPStatus.OK.phrase,
         "status-code": HTTPStatus.OK,
         "data": {
-            "model-type": "mobilenet_v3",
+            "model-type": model_type,
             "prediction": predictions,
             "predicted_class": predicted_label,
         },
@@ -0,0 +1,52 @@
+"""ASGI middleware that stops receiving a request body as soon as it exceeds a size limit."""
+
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BodySizeLimitMiddleware:
+    """
+    Counts the bytes of a request body while it is received, and rejects the request as soon as they exceed
+    `max_bytes`, without receiving the rest of the body.
+
+    Unlike a check of the `Content-Length` header, it also limits chunked bodies and bodies larger than declared. The
+    error is raised while FastAPI parses the body, which turns it into a `413 Request Entity Too Large` response.
+    Therefore, it must be added before any `@app.middleware("http")`, so it runs inside them.
+
+    Parameters
+    ----------
+    app:
+        ASGIApp: The application to protect.
+    max_bytes:
+        int: The maximum size of a request body.
+    path_prefix:
+        str: Only the requests whose path starts with this prefix are limited.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_prefix: str = "/"):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(
+                        status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Request body larger than {self.max_bytes} bytes",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,200 @@
+"""Shadow evaluation: scores the tabular traffic with a candidate model in the background, off the response path."""
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Maximum number of requests waiting to be scored by the candidate model. Requests beyond it are dropped, not queued
+SHADOW_QUEUE_SIZE = 1024
+
+# The candidate model scores up to this many requests at once, waiting at most `SHADOW_MAX_BATCH_WAIT` seconds to fill a
+# batch
+SHADOW_BATCH_SIZE = 64
+SHADOW_MAX_BATCH_WAIT = 0.05
+
+
+def parse_shadow_models(spec: str) -> dict[str, str]:
+    """
+    Parses a list of shadow pairs such as `"LogisticRegression=SVC"`, separated by commas.
+
+    Parameters
+    ----------
+    spec:
+        str: The `primary=candidate` pairs.
+
+    Returns
+    -------
+    dict[str, str]: The candidate model type of each primary model type.
+
+    Raises
+    ------
+    ValueError: If a pair is not of the form `primary=candidate`.
+    """
+    pairs = {}
+    for pair in filter(None, (pair.strip() for pair in spec.split(","))):
+        primary, separator, candidate = pair.partition("=")
+        if not separator or not primary.strip() or not candidate.strip():
+            raise ValueError(f"Invalid shadow model pair {pair!r}, expected 'primary=candidate'")
+        pairs[primary.strip()] = candidate.strip()
+    return pairs
+
+
+class ShadowEvaluator:
+    """
+    Compares a candidate model against a primary model on the requests served by the primary one.
+
+    The API only copies the features, the primary prediction and its latency into a bounded queue, which never blocks.
+    A background thread scores the queued requests with the candidate model in batches and keeps running statistics
+    of the agreement between both models and of their latencies. The primary model is timed per request, while the
+    candidate model is only timed per batch, so their latencies are reported under different names.
+
+    Parameters
+    ----------
+    primary_type:
+        str: The type of the model that serves the requests.
+    candidate:
+        dict: The wrapper of the candidate model, as stored in `model_wrappers_dict`.
+    queue_size:
+        int: Maximum number of requests waiting to be scored.
+    batch_size:
+        int: Maximum number of requests scored at once.
+    max_batch_wait:
+        float: Maximum number of seconds to wait for a batch to fill up.
+    """
+
+    def __init__(
+        self,
+        primary_type: str,
+        candidate: dict,
+        queue_size: int = SHADOW_QUEUE_SIZE,
+        batch_size: int = SHADOW_BATCH_SIZE,
+        max_batch_wait: float = SHADOW_MAX_BATCH_WAIT,
+    ):
+        self.primary_type = primary_type
+        self.candidate = candidate
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+        self.counters = {"submitted": 0, "dropped": 0, "scored": 0, "agreed": 0, "batches": 0, "errors": 0}
+        self._primary_latency = 0.0
+        self._candidate_batch_latency = 0.0
+
+    def start(self):
+        """Starts the background thread."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"shadow-{self.primary_type}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Scores the requests still queued and stops the background thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, features: list[float], prediction: int, latency: float):
+        """
+        Queues a served request to be scored by the candidate model, or drops it if the queue is full.
+
+        Parameters
+        ----------
+        features:
+            list[float]: The features of the request.
+        prediction:
+            int: The prediction of the primary model.
+        latency:
+            float: The time the primary model took to predict, in seconds.
+        """
+        try:
+            self._queue.put_nowait((features, prediction, latency))
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+            return
+
+        with self._lock:
+            self.counters["submitted"] += 1
+
+    def _next_batch(self) -> list[tuple]:
+        """Waits for a queued request and gathers the ones that arrive shortly after, up to `batch_size`."""
+        try:
+            batch = [self._queue.get(timeout=self.max_batch_wait)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _predict(self, features: np.ndarray) -> np.ndarray:
+        if "scorer" in self.candidate:
+            return self.candidate["scorer"].predict(features)
+        return self.candidate["model"].predict(features)
+
+    def _run(self):
+        # Keep scoring until asked to stop and the queue is empty, so no submitted request is lost on shutdown
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._score(batch)
+            elif self._stop_event.is_set():
+                return
+
+    def _score(self, batch: list[tuple]):
+        features, primary_predictions, primary_latencies = zip(*batch, strict=True)
+
+        start = time.perf_counter()
+        try:
+            candidate_predictions = self._predict(np.array(features, dtype=np.float64))
+        except Exception:
+            logging.exception("Shadow model %s failed to score a batch", self.candidate["type"])
+            with self._lock:
+                self.counters["errors"] += 1
+            return
+        elapsed = time.perf_counter() - start
+
+        agreed = int(np.sum(np.asarray(candidate_predictions) == np.asarray(primary_predictions)))
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["scored"] += len(batch)
+            self.counters["agreed"] += agreed
+            self._primary_latency += sum(primary_latencies)
+            self._candidate_batch_latency += elapsed
+
+    def stats(self) -> dict:
+        """
+        Returns the counters, the agreement rate and the mean latencies of both models.
+
+        `primary_latency_ms` is the mean latency of the primary model per request. `candidate_batch_latency_ms` is the
+        mean wall time of the candidate model per batch, and `candidate_amortized_latency_ms` spreads it over the
+        requests of the batches. Neither is the latency of a single request scored alone, so only the amortized one is
+        comparable with the primary latency, as a cost per request.
+        """
+        with self._lock:
+            scored = self.counters["scored"]
+            batches = self.counters["batches"]
+            return {
+                "primary": self.primary_type,
+                "candidate": self.candidate["type"],
+                "queued": self._queue.qsize(),
+                **self.counters,
+                "agreement": self.counters["agreed"] / scored if scored else None,
+                "primary_latency_ms": 1000 * self._primary_latency / scored if scored else None,
+                "candidate_batch_latency_ms": 1000 * self._candidate_batch_latency / batches if batches else None,
+                "candidate_amortized_latency_ms": 1000 * self._candidate_batch_latency / scored if scored else None,
+            }
@@ -1,4 +1,5 @@
 import logging
+import os
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -23,4 +24,11 @@ FIGURES_DIR = REPORTS_DIR / "figures"
 TEST_DIR = PROJ_ROOT / "tests"
 TEST_DATA_DIR = TEST_DIR / "data"
 
+# Limits of the images uploaded to the API
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 2**20))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+
+# Candidate tabular models evaluated in shadow mode against the served ones, e.g. "LogisticRegression=SVC"
+SHADOW_MODELS = os.getenv("SHADOW_MODELS", "")
+
 logging.basicConfig(level=logging.INFO)
@@ -1,22 +1,177 @@
-from deepchecks.vision import classification_dataset_from_directory
+import hashlib
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+from deepchecks.vision import VisionData
 from deepchecks.vision.suites import data_integrity, train_test_validation
+from deepchecks.vision.utils.image_properties import default_image_properties
 
-from src.config import PROCESSED_DATA_DIR, REPORTS_DIR
+from src.config import INTERIM_DATA_DIR, PROCESSED_DATA_DIR, REPORTS_DIR
+from src.features.image_pipeline import dataset_from_paths, decode_image, list_image_directory
 
 OUTPUT_FILE = REPORTS_DIR / "deepchecks_validation.html"
 
-train_ds, test_ds = classification_dataset_from_directory(
-    PROCESSED_DATA_DIR / "euroSAT", object_type="VisionData", image_extension="jpg"
-)
+DATASET_DIR = PROCESSED_DATA_DIR / "euroSAT"
+
+# The properties of the images are cached by the hash of the image file, so a re-run only decodes and measures the
+# images that were added or modified since the previous one
+CACHE_DIR = INTERIM_DATA_DIR / "deepchecks_cache"
+
+
+class DeepchecksBatches:
+    """Re-iterable batch loader in the format expected by Deepchecks, which decodes the images batch by batch."""
+
+    def __init__(self, paths: list[Path], labels: list[int], batch_size: int):
+        # Images are kept at their original size, so they are decoded exactly as when their properties were computed
+        self.dataset = dataset_from_paths(paths, labels, batch_size=batch_size, image_size=None)
+
+    def __iter__(self):
+        for images, labels in self.dataset:
+            yield {"images": images.numpy(), "labels": labels.numpy()}
+
+
+def stratified_sample(paths: list[Path], labels: list[int], fraction: float, random_state: int):
+    """Sample the same fraction of images of each class.
+
+    Args:
+        paths (list[Path]): Paths of the images.
+        labels (list[int]): Label index of each image.
+        fraction (float): Fraction of the images of each class to keep. At least one image per class is kept.
+        random_state (int): Seed of the sampling.
+
+    Returns:
+        Tuple[list[Path], list[int]]: The sampled paths and labels, shuffled.
+    """
+    rng = np.random.default_rng(random_state)
+    labels_array = np.asarray(labels)
+
+    sampled_indices = []
+    for label in np.unique(labels_array):
+        class_indices = np.flatnonzero(labels_array == label)
+        n_samples = max(1, round(fraction * len(class_indices))) if fraction < 1 else len(class_indices)
+        sampled_indices.extend(rng.choice(class_indices, size=n_samples, replace=False))
+
+    sampled_indices = rng.permutation(sampled_indices)
+    return [paths[i] for i in sampled_indices], [labels[i] for i in sampled_indices]
+
+
+def load_image_properties(path: Path, cache_dir: Path = CACHE_DIR) -> tuple[bytes, np.ndarray]:
+    """Compute the Deepchecks properties of an image, using the cache when the file has not changed.
+
+    Args:
+        path (Path): Path of the image.
+        cache_dir (Path): Directory where the properties are cached.
+
+    Returns:
+        Tuple[bytes, np.ndarray]: The digest of the decoded image and the values of its properties.
+    """
+    contents = path.read_bytes()
+    cache_path = cache_dir / f"{hashlib.sha256(contents).hexdigest()}.npz"
+
+    try:
+        with np.load(cache_path) as cached:
+            return cached["image_digest"].tobytes(), cached["properties"]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # Missing or unreadable entry, e.g. one left truncated by an interrupted run, so compute it again
+        pass
+
+    image = decode_image(contents).numpy()
+    image_digest = hashlib.blake2b(image.tobytes()).digest()
+    properties = np.array(
+        [image_property["method"]([image])[0] for image_property in default_image_properties], dtype=np.float64
+    )
+
+    # Write to a temporary file first, so an interrupted run never leaves a truncated entry
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as temp_file:
+        np.savez(temp_file, image_digest=np.frombuffer(image_digest, dtype=np.uint8), properties=properties)
+    os.replace(temp_path, cache_path)
+
+    return image_digest, properties
+
+
+def cached_image_properties(property_cache: dict[bytes, np.ndarray]) -> list[dict]:
+    """Build Deepchecks image properties that read their values from the cache instead of recomputing them.
+
+    Args:
+        property_cache (dict[bytes, np.ndarray]): Property values indexed by the digest of the decoded image.
+
+    Returns:
+        list[dict]: The image properties to pass to the Deepchecks checks.
+    """
+
+    def cached_method(index, method):
+        def compute(images):
+            values = []
+            for image in images:
+                properties = property_cache.get(hashlib.blake2b(image.tobytes()).digest())
+                values.append(properties[index] if properties is not None else method([image])[0])
+            return values
+
+        return compute
+
+    return [
+        {**image_property, "method": cached_method(index, image_property["method"])}
+        for index, image_property in enumerate(default_image_properties)
+    ]
+
+
+def load_vision_data(split: str, params: dict, property_cache: dict[bytes, np.ndarray]) -> VisionData:
+    """Load a sample of a split of the EuroSAT dataset as a Deepchecks `VisionData` object.
+
+    Args:
+        split (str): Name of the split folder (`train` or `test`). Both splits must contain the same class folders.
+        params (dict): The `deepchecks` parameters.
+        property_cache (dict[bytes, np.ndarray]): Dictionary where the properties of the sampled images are added.
+
+    Returns:
+        VisionData: The split ready to be validated by Deepchecks.
+    """
+    paths, labels, class_names = list_image_directory(DATASET_DIR / split, image_extension="jpg")
+    paths, labels = stratified_sample(paths, labels, params["sample_fraction"], params["random_state"])
+
+    # The properties are computed in parallel, since most of the time is spent in I/O and in TensorFlow ops. Only the
+    # properties are kept in memory, while the images are decoded again batch by batch when the suites run
+    with ThreadPoolExecutor(max_workers=params["num_workers"]) as executor:
+        for image_digest, properties in executor.map(load_image_properties, paths):
+            property_cache[image_digest] = properties
+
+    return VisionData(
+        batch_loader=DeepchecksBatches(paths, labels, params["batch_size"]),
+        task_type="classification",
+        label_map=dict(enumerate(class_names)),
+        dataset_name=split,
+        # The sample is already shuffled with a fixed seed
+        reshuffle_data=False,
+    )
+
+
+if __name__ == "__main__":
+    # Read the validation parameters
+    with open("params.yaml", encoding="utf8") as params_file:
+        params = yaml.safe_load(params_file)["deepchecks"]
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    property_cache: dict[bytes, np.ndarray] = {}
+    train_ds = load_vision_data("train", params, property_cache)
+    test_ds = load_vision_data("test", params, property_cache)
+
+    image_properties = cached_image_properties(property_cache)
 
-custom_suite = data_integrity()
+    custom_suite = data_integrity(image_properties=image_properties)
 
-custom_suite.add(train_test_validation())
+    custom_suite.add(train_test_validation(image_properties=image_properties))
 
-result = custom_suite.run(train_ds, test_ds)
+    result = custom_suite.run(train_ds, test_ds)
 
-# If the output file already exists, delete it to avoid duplicates
-if OUTPUT_FILE.exists():
-    OUTPUT_FILE.unlink()
+    # If the output file already exists, delete it to avoid duplicates
+    if OUTPUT_FILE.exists():
+        OUTPUT_FILE.unlink()
 
-result.save_as_html(str(OUTPUT_FILE))
+    result.save_as_html(str(OUTPUT_FILE))
@@ -0,0 +1,98 @@
+"""Schema-driven dtype compaction of the Iowa feature matrices.
+
+`prepare.py` infers the smallest dtype of each column, saves it in a schema next to the processed data and writes the
+compacted data. The rest of the stages read the data with that schema, so the columns are parsed directly into their
+compact dtype instead of `float64`.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILENAME = "schema.json"
+
+INTEGER_DTYPES = ("int8", "int16", "int32", "int64")
+
+# Tree-based models convert their inputs to `float32` anyway, so storing non-integer columns as `float32` does not
+# change their results
+FLOAT_DTYPE = "float32"
+
+
+def infer_column_dtype(values: pd.Series) -> str:
+    """Infer the smallest dtype that can store the values of a column.
+
+    Args:
+        values (pd.Series): The values of the column.
+
+    Returns:
+        str: The smallest integer dtype if all the values are integers, or `FLOAT_DTYPE` otherwise.
+    """
+    if not pd.api.types.is_numeric_dtype(values) or values.isna().any():
+        return FLOAT_DTYPE
+
+    if not np.array_equal(values, np.round(values)):
+        return FLOAT_DTYPE
+
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= values.min() and values.max() <= info.max:
+            return dtype
+
+    return FLOAT_DTYPE
+
+
+def infer_schema(*frames: pd.DataFrame) -> dict[str, str]:
+    """Infer the dtype of every column of a set of data frames.
+
+    Columns with the same name in different data frames (e.g., in the train and validation sets) share their dtype.
+
+    Args:
+        frames (pd.DataFrame): The data frames.
+
+    Returns:
+        dict[str, str]: The dtype of each column.
+    """
+    columns = dict.fromkeys(column for frame in frames for column in frame.columns)
+    return {
+        column: infer_column_dtype(pd.concat([frame[column] for frame in frames if column in frame.columns]))
+        for column in columns
+    }
+
+
+def compact(frame: pd.DataFrame, schema: dict[str, str]) -> pd.DataFrame:
+    """Convert the columns of a data frame to the dtypes of the schema."""
+    return frame.astype({column: dtype for column, dtype in schema.items() if column in frame.columns})
+
+
+def save_schema(schema: dict[str, str], folder: Path):
+    """Save the schema in the folder of the processed data."""
+    with open(folder / SCHEMA_FILENAME, "w") as schema_file:
+        json.dump(schema, schema_file, indent=4)
+
+
+def load_schema(folder: Path) -> dict[str, str]:
+    """Load the schema saved in the folder of the processed data, or an empty schema if there is none."""
+    schema_path = folder / SCHEMA_FILENAME
+    if not schema_path.exists():
+        return {}
+
+    with open(schema_path) as schema_file:
+        return json.load(schema_file)
+
+
+def read_csv(path: Path, schema: dict[str, str] | None = None) -> pd.DataFrame:
+    """Read a processed CSV file, parsing its columns directly into the dtypes of the schema.
+
+    Args:
+        path (Path): The CSV file.
+        schema (dict[str, str] | None): The schema. If `None`, it is loaded from the folder of the file.
+
+    Returns:
+        pd.DataFrame: The data.
+    """
+    if schema is None:
+        schema = load_schema(path.parent)
+
+    return pd.read_csv(path, dtype=schema or None)
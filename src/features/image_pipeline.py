@@ -0,0 +1,229 @@
+"""Reusable `tf.data` input pipeline to decode, resize and batch images.
+
+The same preprocessing is shared by the API (uploaded byte streams) and the offline tools that work with image
+directories, such as batch scoring or the Deepchecks validation of the EuroSAT dataset.
+"""
+
+import functools
+import io
+from collections.abc import Iterable
+from pathlib import Path
+
+import tensorflow as tf
+from PIL import Image
+
+# Input resolution expected by the MobileNetV3 model
+IMAGE_SIZE = (224, 224)
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def decode_image(contents: tf.Tensor, image_size: tuple[int, int] | None = None) -> tf.Tensor:
+    """
+    Decodes an encoded image (JPEG, PNG, BMP or the first frame of a GIF) into a `uint8` RGB tensor.
+
+    If `image_size` is given, JPEG images much larger than it are decoded directly at 1/2, 1/4 or 1/8 of their size,
+    while staying at least as large as `image_size`. This bounds the memory needed to decode large images before
+    resizing them. Other formats are fully decoded. It runs both eagerly and inside `tf.data`.
+
+    Parameters
+    ----------
+    contents:
+        tf.Tensor: A scalar string tensor with the encoded image.
+    image_size:
+        tuple[int, int] | None: The (height, width) the image will be resized to. If `None`, the image is fully decoded.
+
+    Returns
+    -------
+    Tensor: A `uint8` tensor of shape [height, width, 3].
+    """
+
+    def decode_full():
+        # `expand_animations=False` guarantees a 3D tensor, which is required by `tf.image.resize` inside `tf.data`
+        return tf.io.decode_image(contents, channels=3, expand_animations=False)
+
+    if image_size is None:
+        return decode_full()
+
+    def decode_jpeg_reduced():
+        height, width = tf.unstack(tf.io.extract_jpeg_shape(contents)[:2])
+        # The first matching branch is used, so the largest ratio that keeps the image larger than `image_size` wins
+        branches = [
+            (
+                tf.logical_and(height // ratio >= image_size[0], width // ratio >= image_size[1]),
+                functools.partial(tf.io.decode_jpeg, contents, channels=3, ratio=ratio),
+            )
+            for ratio in (8, 4, 2)
+        ]
+        return tf.case(branches, default=functools.partial(tf.io.decode_jpeg, contents, channels=3))
+
+    return tf.cond(tf.io.is_jpeg(contents), decode_jpeg_reduced, decode_full)
+
+
+def image_dimensions(contents: bytes) -> tuple[int, int]:
+    """
+    Reads the dimensions of an encoded image from its header, without decoding it.
+
+    Parameters
+    ----------
+    contents:
+        bytes: The encoded image.
+
+    Returns
+    -------
+    tuple[int, int]: The (height, width) of the image.
+
+    Raises
+    ------
+    PIL.UnidentifiedImageError: If the contents are not a supported image.
+    """
+    with Image.open(io.BytesIO(contents)) as image:
+        width, height = image.size
+    return height, width
+
+
+def preprocess_image(image: tf.Tensor, image_size: tuple[int, int] = IMAGE_SIZE) -> tf.Tensor:
+    """
+    Resizes a decoded image and scales its values to the [0, 1] range expected by the model.
+
+    Resizing the `uint8` image and scaling afterwards is equivalent to decoding directly to `float32`, but avoids
+    allocating a full-resolution `float32` buffer.
+
+    Parameters
+    ----------
+    image:
+        tf.Tensor: A `uint8` tensor of shape [height, width, 3].
+    image_size:
+        tuple[int, int]: The target (height, width).
+
+    Returns
+    -------
+    Tensor: A `float32` tensor of shape [*image_size, 3] with values in [0, 1].
+    """
+    image = tf.image.resize(image, image_size)
+    return image / 255.0
+
+
+def file_to_image(file: bytes, image_size: tuple[int, int] = IMAGE_SIZE) -> tf.Tensor:
+    """
+    Reads an image file and formats it for the model.
+
+    Parameters
+    ----------
+    file:
+        bytes: The image file to classify.
+    image_size:
+        tuple[int, int]: The target (height, width).
+
+    Returns
+    -------
+    Tensor: The image formatted for the model.
+    """
+    return preprocess_image(decode_image(file, image_size), image_size)
+
+
+def _batch(dataset: tf.data.Dataset, batch_size: int) -> tf.data.Dataset:
+    """Batches a dataset and prefetches the next batches while the current one is being consumed."""
+    return dataset.batch(batch_size, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+
+def dataset_from_bytes(
+    streams: Iterable[bytes],
+    batch_size: int = 32,
+    image_size: tuple[int, int] | None = IMAGE_SIZE,
+) -> tf.data.Dataset:
+    """
+    Builds a batched dataset from a collection of encoded images.
+
+    Parameters
+    ----------
+    streams:
+        Iterable[bytes]: The encoded images.
+    batch_size:
+        int: Number of images per batch.
+    image_size:
+        tuple[int, int] | None: The target (height, width). If `None`, images are kept as decoded `uint8` tensors, so
+        all of them must have the same size.
+
+    Returns
+    -------
+    tf.data.Dataset: A dataset that yields batches of images.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(tf.constant(list(streams), dtype=tf.string))
+
+    if image_size is None:
+        dataset = dataset.map(decode_image, num_parallel_calls=AUTOTUNE)
+    else:
+        dataset = dataset.map(lambda contents: file_to_image(contents, image_size), num_parallel_calls=AUTOTUNE)
+
+    return _batch(dataset, batch_size)
+
+
+def list_image_directory(directory: Path, image_extension: str = "jpg") -> tuple[list[Path], list[int], list[str]]:
+    """
+    Lists the images of a directory structured as `directory/<class_name>/<image>.<image_extension>`.
+
+    Parameters
+    ----------
+    directory:
+        Path: The root directory.
+    image_extension:
+        str: The extension of the image files.
+
+    Returns
+    -------
+    tuple[list[Path], list[int], list[str]]: The image paths, their label indices and the sorted class names.
+    """
+    class_names = sorted(path.name for path in directory.iterdir() if path.is_dir())
+
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_paths = sorted((directory / class_name).glob(f"*.{image_extension}"))
+        paths.extend(class_paths)
+        labels.extend([label] * len(class_paths))
+
+    return paths, labels, class_names
+
+
+def dataset_from_paths(
+    paths: list[Path],
+    labels: list[int],
+    batch_size: int = 32,
+    image_size: tuple[int, int] | None = IMAGE_SIZE,
+    shuffle_seed: int | None = None,
+) -> tf.data.Dataset:
+    """
+    Builds a batched dataset of (images, labels) from a list of image files.
+
+    Files are read and decoded in parallel, and the next batches are prefetched while the current one is consumed.
+
+    Parameters
+    ----------
+    paths:
+        list[Path]: The image files.
+    labels:
+        list[int]: The label index of each image.
+    batch_size:
+        int: Number of images per batch.
+    image_size:
+        tuple[int, int] | None: The target (height, width). If `None`, images are kept as decoded `uint8` tensors, so
+        all of them must have the same size.
+    shuffle_seed:
+        int | None: If given, the files are shuffled with this seed before being read.
+
+    Returns
+    -------
+    tf.data.Dataset: A dataset that yields (images, labels) batches.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(([str(path) for path in paths], labels))
+
+    if shuffle_seed is not None:
+        dataset = dataset.shuffle(len(paths), seed=shuffle_seed, reshuffle_each_iteration=False)
+
+    def load(path, label):
+        image = decode_image(tf.io.read_file(path), image_size)
+        if image_size is not None:
+            image = preprocess_image(image, image_size)
+        return image, label
+
+    return _batch(dataset.map(load, num_parallel_calls=AUTOTUNE), batch_size)
@@ -0,0 +1,218 @@
+"""Incremental version of the data preparation stage.
+
+The raw training data is read in partitions of consecutive rows. The result of each partition (its train/validation
+split, with numerical predictors only, and the partial sums and counts needed by the mean imputer) is stored in a
+content-addressed cache. When new rows are appended to the raw data, only the partitions that changed are processed
+again, and the cached partial results are merged to impute and write the prepared data.
+
+The split of each row only depends on its `Id`, so appending rows never moves the existing ones between the training
+and validation sets, whatever partition they fall in.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import INTERIM_DATA_DIR
+
+CACHE_DIR = INTERIM_DATA_DIR / "prepare_cache"
+
+# Bump it whenever `process_partition` changes, so old cache entries are not reused
+CACHE_VERSION = 2
+
+
+def partition_key(partition: pd.DataFrame, params: dict) -> str:
+    """Compute the cache key of a partition from its content and the preparation parameters.
+
+    Args:
+        partition (pd.DataFrame): A partition of the raw training data.
+        params (dict): The `prepare` parameters.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest identifying the partition.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((CACHE_VERSION, params["train_size"], params["test_size"], params["random_state"])).encode())
+    digest.update(repr(list(partition.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(partition, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def split_positions(ids: pd.Index, params: dict) -> np.ndarray:
+    """Map each row id to a deterministic pseudo-random position in [0, 1), which decides its split.
+
+    Rows whose position is below `test_size` go to the validation set, the next `train_size` to the training set, and
+    the rest are discarded, as `train_test_split` does when both sizes do not add up to 1.
+
+    Args:
+        ids (pd.Index): The ids of the rows.
+        params (dict): The `prepare` parameters.
+
+    Returns:
+        np.ndarray: The position of each row.
+    """
+    # The hash key must be 16 characters long, and the random state is used to draw a different split
+    hash_key = f"{params['random_state']:016d}"[-16:]
+    hashes = pd.util.hash_array(ids.to_numpy(), hash_key=hash_key)
+    # Keep 53 bits, which a float64 represents exactly, so the positions never round up to 1
+    return (hashes >> np.uint64(11)) / 2.0**53
+
+
+def process_partition(partition: pd.DataFrame, params: dict) -> dict:
+    """Split a partition and compute the partial statistics of the mean imputer.
+
+    Args:
+        partition (pd.DataFrame): A partition of the raw training data.
+        params (dict): The `prepare` parameters.
+
+    Returns:
+        dict: The train and validation predictors and targets, the non-numerical columns of the partition, and the
+            sum and count of the non-missing training values of each column.
+    """
+    # Remove rows with missing target
+    partition = partition.dropna(axis=0, subset=["SalePrice"])
+
+    # Separate target from predictors
+    y = partition.SalePrice
+    X_full = partition.drop(["SalePrice"], axis=1)
+
+    # A column is numerical only if it is numerical in every partition, so we keep track of the other ones
+    X = X_full.select_dtypes(exclude=["object"])
+    object_columns = [column for column in X_full.columns if column not in X.columns]
+
+    positions = split_positions(X.index, params)
+    valid_mask = positions < params["test_size"]
+    train_mask = ~valid_mask & (positions < params["test_size"] + params["train_size"])
+    X_train, X_valid, y_train, y_valid = X[train_mask], X[valid_mask], y[train_mask], y[valid_mask]
+
+    return {
+        "X_train": X_train,
+        "X_valid": X_valid,
+        "y_train": y_train,
+        "y_valid": y_valid,
+        "object_columns": object_columns,
+        "sums": X_train.sum(),
+        "counts": X_train.count(),
+    }
+
+
+def load_partition(
+    partition: pd.DataFrame, params: dict, cache_dir: Path = CACHE_DIR, key: str | None = None
+) -> tuple[dict, bool]:
+    """Return the result of a partition, processing it only if it is not cached yet.
+
+    Args:
+        partition (pd.DataFrame): A partition of the raw training data.
+        params (dict): The `prepare` parameters.
+        cache_dir (Path): Folder of the cache.
+        key (str | None): The cache key of the partition, computed with `partition_key` if not given.
+
+    Returns:
+        Tuple[dict, bool]: The result of the partition and whether it was read from the cache.
+    """
+    cache_path = cache_dir / f"{key or partition_key(partition, params)}.pkl"
+
+    try:
+        with open(cache_path, "rb") as cache_file:
+            return pickle.load(cache_file), True
+    except (OSError, EOFError, pickle.UnpicklingError):
+        # Missing or unreadable entry, e.g. one left truncated by an interrupted run, so process the partition again
+        pass
+
+    result = process_partition(partition, params)
+
+    # Write to a temporary file first, so an interrupted run never leaves a truncated entry
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as temp_file:
+        pickle.dump(result, temp_file)
+    os.replace(temp_path, cache_path)
+
+    return result, False
+
+
+def prune_cache(used_keys: set[str], cache_dir: Path = CACHE_DIR) -> int:
+    """Delete the cache entries that were not used, such as the old entry of a partition that got new rows.
+
+    Args:
+        used_keys (set[str]): The keys of the partitions of the current raw data.
+        cache_dir (Path): Folder of the cache.
+
+    Returns:
+        int: The number of deleted entries.
+    """
+    # Temporary files are only left behind by interrupted runs
+    stale_paths = [path for path in cache_dir.glob("*.pkl") if path.stem not in used_keys]
+    stale_paths += cache_dir.glob("*.tmp")
+    for path in stale_paths:
+        path.unlink(missing_ok=True)
+    return len(stale_paths)
+
+
+def merge_partitions(results: list[dict]):
+    """Merge the partition results and impute the missing values with the mean of the training data.
+
+    Columns that are not numerical in every partition are discarded, and so are the columns without any training
+    value, as `SimpleImputer` does.
+
+    Args:
+        results (list[dict]): The results of the partitions, in order.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]: The imputed train and validation predictors and the
+            train and validation targets.
+    """
+    object_columns = {column for result in results for column in result["object_columns"]}
+    sums = sum(result["sums"] for result in results)
+    counts = sum(result["counts"] for result in results)
+
+    columns = [column for column in results[0]["X_train"].columns if column not in object_columns]
+    columns = [column for column in columns if counts.get(column, 0) > 0]
+    means = sums[columns] / counts[columns]
+
+    def impute(frames):
+        X = pd.concat([frame[columns] for frame in frames])
+        return X.fillna(means).astype("float64").reset_index(drop=True)
+
+    X_train = impute([result["X_train"] for result in results])
+    X_valid = impute([result["X_valid"] for result in results])
+    y_train = pd.concat([result["y_train"] for result in results])
+    y_valid = pd.concat([result["y_valid"] for result in results])
+
+    return X_train, X_valid, y_train, y_valid
+
+
+def prepare_incremental(train_path: Path, params: dict):
+    """Prepare the training data partition by partition, reusing the cached partitions.
+
+    Args:
+        train_path (Path): Path of the raw training data.
+        params (dict): The `prepare` parameters.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]: The imputed train and validation predictors and the
+            train and validation targets.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    used_keys = set()
+    n_processed = 0
+    for partition in pd.read_csv(train_path, index_col="Id", chunksize=params["partition_size"]):
+        key = partition_key(partition, params)
+        result, cached = load_partition(partition, params, key=key)
+        results.append(result)
+        used_keys.add(key)
+        n_processed += not cached
+
+    n_pruned = prune_cache(used_keys)
+    print(
+        f"Processed {n_processed} of {len(results)} partitions, the rest were cached. "
+        f"Deleted {n_pruned} unused cache entries."
+    )
+
+    return merge_partitions(results)
@@ -6,6 +6,9 @@ from sklearn.impute import SimpleImputer
 from sklearn.model_selection import train_test_split
 
 from src.config import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from src.features.dtypes import compact, infer_schema, save_schema
+from src.features.incremental import prepare_incremental
+from src.profiling import StageProfiler
 
 # Path of the parameters file
 params_path = Path("params.yaml")
@@ -17,10 +20,6 @@ input_folder_path = RAW_DATA_DIR
 train_path = input_folder_path / "train.csv"
 test_path = input_folder_path / "test.csv"
 
-# Read dataset from csv file
-train_data = pd.read_csv(train_path, index_col="Id")
-test_data = pd.read_csv(test_path, index_col="Id")
-
 # Read data preparation parameters
 with open(params_path) as params_file:
     try:
@@ -30,42 +29,58 @@ with open(params_path) as params_file:
         print(exc)
 
 
+# Profile the steps of the stage if `profile.enabled` is set
+profiler = StageProfiler.from_params("prepare", params_path)
+
 # ================ #
 # DATA PREPARATION #
 # ================ #
 
-# Remove rows with missing target
-train_data.dropna(axis=0, subset=["SalePrice"], inplace=True)
-
-# Separate target from predictors
-y = train_data.SalePrice
-
-# Create a DataFrame called `X` holding the predictive features.
-X_full = train_data.drop(["SalePrice"], axis=1)
-
-# To keep things simple, we'll use only numerical predictors
-X = X_full.select_dtypes(exclude=["object"])
-X_test = test_data.select_dtypes(exclude=["object"])
-
-# Break off validation set from training data
-X_train, X_valid, y_train, y_valid = train_test_split(
-    X,
-    y,
-    train_size=params["train_size"],
-    test_size=params["test_size"],
-    random_state=params["random_state"],
-)
-
-# Handle Missing Values with Imputation
-my_imputer = SimpleImputer()
-imputed_X_train = pd.DataFrame(my_imputer.fit_transform(X_train))
-imputed_X_valid = pd.DataFrame(my_imputer.transform(X_valid))
-
-# Imputation removed column names so we put them back
-imputed_X_train.columns = X_train.columns
-imputed_X_valid.columns = X_valid.columns
-X_train = imputed_X_train
-X_valid = imputed_X_valid
+if params["incremental"]:
+    # Split and clean the data by partitions of rows, reusing the partitions cached in previous runs.
+    # Note that the split of each row is drawn from its `Id`, so it differs from the one of the non-incremental mode
+    with profiler.step("incremental_prepare"):
+        X_train, X_valid, y_train, y_valid = prepare_incremental(train_path, params)
+else:
+    # Read dataset from csv file
+    with profiler.step("read_csv"):
+        train_data = pd.read_csv(train_path, index_col="Id")
+        test_data = pd.read_csv(test_path, index_col="Id")
+
+    with profiler.step("split"):
+        # Remove rows with missing target
+        train_data.dropna(axis=0, subset=["SalePrice"], inplace=True)
+
+        # Separate target from predictors
+        y = train_data.SalePrice
+
+        # Create a DataFrame called `X` holding the predictive features.
+        X_full = train_data.drop(["SalePrice"], axis=1)
+
+        # To keep things simple, we'll use only numerical predictors
+        X = X_full.select_dtypes(exclude=["object"])
+        X_test = test_data.select_dtypes(exclude=["object"])
+
+        # Break off validation set from training data
+        X_train, X_valid, y_train, y_valid = train_test_split(
+            X,
+            y,
+            train_size=params["train_size"],
+            test_size=params["test_size"],
+            random_state=params["random_state"],
+        )
+
+    # Handle Missing Values with Imputation
+    with profiler.step("imputation"):
+        my_imputer = SimpleImputer()
+        imputed_X_train = pd.DataFrame(my_imputer.fit_transform(X_train))
+        imputed_X_valid = pd.DataFrame(my_imputer.transform(X_valid))
+
+    # Imputation removed column names so we put them back
+    imputed_X_train.columns = X_train.columns
+    imputed_X_valid.columns = X_valid.columns
+    X_train = imputed_X_train
+    X_valid = imputed_X_valid
 
 # Path of the output data folder
 prepared_folder_path = PROCESSED_DATA_DIR / "iowa_dataset"
@@ -76,14 +91,26 @@ y_train_path = prepared_folder_path / "y_train.csv"
 X_valid_path = prepared_folder_path / "X_valid.csv"
 y_valid_path = prepared_folder_path / "y_valid.csv"
 
-X_train.to_csv(X_train_path, index=False)
-print(f"Writing file {X_train_path} to disk.")
+# Store each column with the smallest dtype that fits its values (e.g., `int16` for `YearBuilt`) instead of `float64`.
+# The schema is saved next to the data so the next stages can read it with the same dtypes
+with profiler.step("infer_schema"):
+    y_train = y_train.reset_index()
+    y_valid = y_valid.reset_index()
+    schema = infer_schema(X_train, X_valid, y_train, y_valid)
+    save_schema(schema, prepared_folder_path)
+print(f"Writing schema {prepared_folder_path / 'schema.json'} to disk.")
+
+with profiler.step("write_csv"):
+    compact(X_train, schema).to_csv(X_train_path, index=False)
+    print(f"Writing file {X_train_path} to disk.")
+
+    compact(y_train, schema).to_csv(y_train_path, index=False)
+    print(f"Writing file {y_train_path} to disk.")
 
-y_train.to_csv(y_train_path)
-print(f"Writing file {y_train_path} to disk.")
+    compact(X_valid, schema).to_csv(X_valid_path, index=False)
+    print(f"Writing file {X_valid_path} to disk.")
 
-X_valid.to_csv(X_valid_path, index=False)
-print(f"Writing file {X_valid_path} to disk.")
+    compact(y_valid, schema).to_csv(y_valid_path, index=False)
+    print(f"Writing file {y_valid_path} to disk.")
 
-y_valid.to_csv(y_valid_path)
-print(f"Writing file {y_valid_path} to disk.")
+profiler.save()
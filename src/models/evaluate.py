@@ -3,17 +3,19 @@ import pickle
 from pathlib import Path
 
 import mlflow
-import pandas as pd
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 
 from src.config import METRICS_DIR, PROCESSED_DATA_DIR
+from src.features.dtypes import read_csv
+from src.models.mlflow_logger import AsyncMlflowLogger
+from src.profiling import StageProfiler
 
 # Path to the models folder
 MODELS_FOLDER_PATH = Path("models")
 
 
 def load_validation_data(input_folder_path: Path):
-    """Load the validation data from the prepared data folder.
+    """Load the validation data from the prepared data folder, using the dtypes of its schema.
 
     Args:
         input_folder_path (Path): Path to the prepared data folder.
@@ -21,8 +23,8 @@ def load_validation_data(input_folder_path: Path):
     Returns:
         Tuple[pd.DataFrame, pd.DataFrame]: Tuple containing the validation features and target.
     """
-    X_valid = pd.read_csv(input_folder_path / "X_valid.csv")
-    y_valid = pd.read_csv(input_folder_path / "y_valid.csv")
+    X_valid = read_csv(input_folder_path / "X_valid.csv")
+    y_valid = read_csv(input_folder_path / "y_valid.csv")
 
     return X_valid, y_valid
 
@@ -56,19 +58,24 @@ if __name__ == "__main__":
     Path("metrics").mkdir(exist_ok=True)
     metrics_folder_path = METRICS_DIR
 
-    X_valid, y_valid = load_validation_data(PROCESSED_DATA_DIR / "iowa_dataset")
+    # Profile the steps of the stage if `profile.enabled` is set
+    profiler = StageProfiler.from_params("evaluate")
+
+    with profiler.step("read_csv"):
+        X_valid, y_valid = load_validation_data(PROCESSED_DATA_DIR / "iowa_dataset")
 
     mlflow.set_experiment("iowa-house-prices")
 
-    with mlflow.start_run():
+    with mlflow.start_run(), AsyncMlflowLogger() as mlflow_logger:
         # Load the model
-        val_mae, val_mean_squared_error = evaluate_model("iowa_model.pkl", X_valid, y_valid)
+        with profiler.step("evaluate"):
+            val_mae, val_mean_squared_error = evaluate_model("iowa_model.pkl", X_valid, y_valid)
 
         # Save the evaluation metrics to a dictionary to be reused later
         metrics_dict = {"mae": val_mae, "mean_squared_error": val_mean_squared_error}
 
-        # Log the evaluation metrics to MLflow
-        mlflow.log_metrics(metrics_dict)
+        # Log the evaluation metrics to MLflow without waiting for the tracking server
+        mlflow_logger.log_metrics(metrics_dict)
 
         # Save the evaluation metrics to a JSON file
         with open(metrics_folder_path / "scores.json", "w") as scores_file:
@@ -78,4 +85,6 @@ if __name__ == "__main__":
                 indent=4,
             )
 
+        profiler.save()
+
         print("Evaluation completed.")
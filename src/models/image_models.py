@@ -0,0 +1,152 @@
+"""Registry and loaders of the image classification models served by the API."""
+
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_hub as hub
+
+from src.config import MODELS_DIR
+from src.features.image_pipeline import IMAGE_SIZE
+
+MOBILENET_V3_URL = "https://www.kaggle.com/models/google/mobilenet-v3/TensorFlow2/small-075-224-classification/1"
+
+# Image models that can be served, with the numerical precision used to run them. The `float32` model is the original
+# TF Hub layer, while the reduced-precision variants are TFLite models exported by `quantize_image_model.py`
+IMAGE_MODEL_REGISTRY: dict[str, dict] = {
+    "mobilenet_v3": {"precision": "float32"},
+    "mobilenet_v3_float16": {"precision": "float16"},
+    "mobilenet_v3_int8": {"precision": "int8"},
+}
+
+SUPPORTED_PRECISIONS = ("float32", "float16", "int8")
+
+
+class TFLiteImageModel:
+    """
+    Wraps a TFLite model so it can be called like the TF Hub layer.
+
+    TFLite runs on the CPU with the XNNPACK delegate, which is enabled by default for floating point and quantized
+    models.
+
+    Parameters
+    ----------
+    model_path:
+        Path: The `.tflite` file to load.
+    num_threads:
+        int | None: Number of CPU threads used by the interpreter. If `None`, TFLite decides.
+    """
+
+    def __init__(self, model_path: Path, num_threads: int | None = None):
+        self.model_path = model_path
+        self._interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self._input_index = self._interpreter.get_input_details()[0]["index"]
+        self._output_index = self._interpreter.get_output_details()[0]["index"]
+        self._batch_size = None
+        # The interpreter is stateful, so concurrent requests must not use it at the same time
+        self._lock = threading.Lock()
+
+    def __call__(self, images) -> tf.Tensor:
+        """
+        Classifies a batch of images.
+
+        Parameters
+        ----------
+        images:
+            A `float32` tensor or array of shape [batch_size, height, width, 3] with values in [0, 1].
+
+        Returns
+        -------
+        Tensor: The logits of the model, of shape [batch_size, num_classes].
+        """
+        images = np.asarray(images, dtype=np.float32)
+
+        with self._lock:
+            if images.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input_index, images.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = images.shape[0]
+
+            self._interpreter.set_tensor(self._input_index, images)
+            self._interpreter.invoke()
+            predictions = self._interpreter.get_tensor(self._output_index)
+
+        return tf.convert_to_tensor(predictions)
+
+
+def tflite_model_path(model_type: str) -> Path:
+    """Returns the path where the TFLite version of an image model is stored."""
+    return MODELS_DIR / f"{model_type}.tflite"
+
+
+def load_image_model(model_type: str, num_threads: int | None = None):
+    """
+    Loads an image model of the registry.
+
+    Parameters
+    ----------
+    model_type:
+        str: The name of the model in `IMAGE_MODEL_REGISTRY`.
+    num_threads:
+        int | None: Number of CPU threads used by reduced-precision models.
+
+    Returns
+    -------
+    The model, a callable that maps a batch of images to logits, or `None` if a reduced-precision model has not been
+    exported yet.
+    """
+    precision = IMAGE_MODEL_REGISTRY[model_type]["precision"]
+
+    if precision == "float32":
+        return hub.KerasLayer(MOBILENET_V3_URL)
+
+    model_path = tflite_model_path(model_type)
+    if not model_path.exists():
+        logging.warning("Model %s not found. Run `python -m src.models.quantize_image_model` to export it.", model_path)
+        return None
+
+    return TFLiteImageModel(model_path, num_threads=num_threads)
+
+
+def convert_to_tflite(precision: str, representative_images: tf.data.Dataset | None = None) -> bytes:
+    """
+    Converts the MobileNetV3 model to a reduced-precision TFLite model.
+
+    Parameters
+    ----------
+    precision:
+        str: `float16` to store the weights as half-precision floats, or `int8` to quantize weights and activations.
+    representative_images:
+        tf.data.Dataset | None: Batches of preprocessed images used to calibrate the activation ranges of the `int8`
+        model. If `None`, only the weights are quantized (dynamic range quantization).
+
+    Returns
+    -------
+    bytes: The serialized TFLite model.
+    """
+    if precision not in SUPPORTED_PRECISIONS[1:]:
+        raise ValueError(f"Unsupported precision for TFLite conversion: {precision}")
+
+    layer = hub.KerasLayer(MOBILENET_V3_URL)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, *IMAGE_SIZE, 3], tf.float32)])
+    def classify(images):
+        return layer(images)
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([classify.get_concrete_function()], layer)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if precision == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif representative_images is not None:
+
+        def representative_dataset():
+            for batch in representative_images.unbatch().batch(1):
+                yield [batch]
+
+        # Inputs and outputs are kept as float32 so the model is a drop-in replacement of the original one
+        converter.representative_dataset = representative_dataset
+
+    return converter.convert()
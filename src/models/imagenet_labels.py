@@ -0,0 +1,131 @@
+"""In-memory ImageNet label table and vectorized top-k decoding of the image model predictions."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from src.config import MODELS_DIR
+
+# Local copy of the ImageNet class names, committed so the API does not need to download the Keras class index
+LABELS_PATH = MODELS_DIR / "imagenet_labels.json"
+
+NUM_IMAGENET_CLASSES = 1000
+
+KERAS_CLASS_INDEX_URL = "https://storage.googleapis.com/download.tensorflow.org/data/imagenet_class_index.json"
+
+
+def export_imagenet_labels(labels_path: Path = LABELS_PATH):
+    """
+    Writes the ImageNet class names of Keras' class index to `labels_path`, as a list of `[wordnet_id, name]` pairs.
+
+    Only needed to regenerate the committed copy. Keras downloads the class index the first time and keeps it in its
+    cache (`~/.keras/models`).
+
+    Parameters
+    ----------
+    labels_path:
+        Path: The file to write.
+    """
+    class_index_path = tf.keras.utils.get_file(
+        "imagenet_class_index.json",
+        KERAS_CLASS_INDEX_URL,
+        cache_subdir="models",
+    )
+    with open(class_index_path) as class_index_file:
+        class_index = json.load(class_index_file)
+
+    # One `[wordnet_id, name]` pair per line, so a regenerated file diffs cleanly against the committed one
+    pairs = (json.dumps(class_index[str(i)]) for i in range(len(class_index)))
+    with open(labels_path, "w") as labels_file:
+        labels_file.write("[\n" + ",\n".join(pairs) + "\n]\n")
+
+
+def load_imagenet_labels(labels_path: Path = LABELS_PATH) -> np.ndarray:
+    """
+    Loads the ImageNet class names from the local copy, without any network access.
+
+    Parameters
+    ----------
+    labels_path:
+        Path: The file with the class names.
+
+    Returns
+    -------
+    np.ndarray: The class names, indexed by class id.
+
+    Raises
+    ------
+    FileNotFoundError: If the local copy does not exist.
+    ValueError: If the local copy does not have one name per ImageNet class.
+    """
+    if not labels_path.exists():
+        raise FileNotFoundError(
+            f"ImageNet labels not found in {labels_path}. Restore the committed file, or regenerate it with "
+            "`python -m src.models.imagenet_labels` (requires Internet access)."
+        )
+
+    with open(labels_path) as labels_file:
+        labels = np.array([name for _, name in json.load(labels_file)])
+
+    if len(labels) != NUM_IMAGENET_CLASSES:
+        raise ValueError(f"Expected {NUM_IMAGENET_CLASSES} ImageNet labels in {labels_path}, found {len(labels)}")
+    return labels
+
+
+def top_k(scores, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the `k` highest scores of each row of a batch, in descending order.
+
+    Only the `k` highest scores of each row are sorted, instead of the whole row.
+
+    Parameters
+    ----------
+    scores:
+        Array-like of shape [batch_size, num_classes].
+    k:
+        int: Number of classes to return per row.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]: The class ids and the scores, both of shape [batch_size, k].
+    """
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[1])
+
+    indices = np.argpartition(scores, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def decode_top_k(scores, labels: np.ndarray, k: int = 1) -> list[list[tuple[str, float]]]:
+    """
+    Decodes the `k` most likely classes of each image of a batch.
+
+    Parameters
+    ----------
+    scores:
+        Array-like of shape [batch_size, num_classes].
+    labels:
+        np.ndarray: The class names, indexed by class id.
+    k:
+        int: Number of classes to return per image.
+
+    Returns
+    -------
+    list[list[tuple[str, float]]]: The (class name, score) pairs of each image, from most to least likely.
+    """
+    indices, top_scores = top_k(scores, k)
+    names = labels[indices]
+    return [
+        list(zip(row_names.tolist(), row_scores.tolist(), strict=True))
+        for row_names, row_scores in zip(names, top_scores, strict=True)
+    ]
+
+
+if __name__ == "__main__":
+    export_imagenet_labels()
+    print(f"Writing file {LABELS_PATH} to disk.")
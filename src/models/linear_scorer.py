@@ -0,0 +1,122 @@
+"""Pure-NumPy scorers for the linear Iris models, built from the trained scikit-learn estimators."""
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import SVC
+
+
+class LinearScorer:
+    """
+    Predicts with the coefficient and intercept matrices of a linear classifier, without scikit-learn's validation.
+
+    Parameters
+    ----------
+    coef:
+        np.ndarray: The coefficients of the decision functions, of shape [n_decision_functions, n_features].
+    intercept:
+        np.ndarray: The intercepts of the decision functions, of shape [n_decision_functions].
+    classes:
+        np.ndarray: The class labels.
+    strategy:
+        str: `ovr` if there is a decision function per class (one-vs-rest), or a single one whose positive values
+        predict the second class, or `ovo` if there is one per pair of classes (one-vs-one).
+    """
+
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray, classes: np.ndarray, strategy: str):
+        if strategy not in ("ovr", "ovo"):
+            raise ValueError(f"Unknown strategy: {strategy}")
+
+        self.coef = np.ascontiguousarray(coef, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes = np.asarray(classes)
+        self.strategy = strategy
+
+        # Pairs of classes compared by each one-vs-one decision function, in the same order as libsvm
+        n_classes = len(self.classes)
+        self._pairs = np.array([(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)], dtype=np.intp)
+
+    @classmethod
+    def from_estimator(cls, estimator) -> "LinearScorer":
+        """Extracts the coefficient and intercept matrices of a fitted `LogisticRegression` or linear `SVC`."""
+        if isinstance(estimator, LogisticRegression):
+            strategy = "ovr"
+        elif isinstance(estimator, SVC) and estimator.kernel == "linear":
+            if estimator.decision_function_shape == "ovr" and estimator.break_ties:
+                raise ValueError("SVC with `break_ties=True` is not supported")
+            # scikit-learn flips the sign of a binary SVC so that, as for `LogisticRegression`, a positive decision
+            # predicts the second class, which is the opposite of the one-vs-one vote
+            strategy = "ovr" if len(estimator.classes_) == 2 else "ovo"
+        else:
+            raise ValueError(f"Unsupported estimator: {estimator!r}")
+
+        return cls(estimator.coef_, estimator.intercept_, estimator.classes_, strategy)
+
+    def decision_function(self, x) -> np.ndarray:
+        """Computes the raw decision functions of a batch of samples of shape [n_samples, n_features]."""
+        return np.asarray(x, dtype=np.float64) @ self.coef.T + self.intercept
+
+    def predict(self, x) -> np.ndarray:
+        """
+        Predicts the class of a batch of samples.
+
+        Parameters
+        ----------
+        x:
+            Array-like of shape [n_samples, n_features].
+
+        Returns
+        -------
+        np.ndarray: The predicted class labels.
+        """
+        scores = self.decision_function(x)
+
+        if self.strategy == "ovo":
+            # Each positive decision votes for the first class of the pair, otherwise for the second one
+            winners = np.where(scores > 0, self._pairs[:, 0], self._pairs[:, 1])
+            votes = np.zeros((scores.shape[0], len(self.classes)), dtype=np.intp)
+            np.add.at(votes, (np.arange(scores.shape[0])[:, np.newaxis], winners), 1)
+            # Ties are resolved in favour of the class with the lowest index, as libsvm does
+            return self.classes[votes.argmax(axis=1)]
+
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(np.intp)]
+        return self.classes[scores.argmax(axis=1)]
+
+    def predict_one(self, features) -> int:
+        """Predicts the class of a single sample with one matrix-vector product."""
+        scores = self.coef @ np.asarray(features, dtype=np.float64) + self.intercept
+
+        if self.strategy == "ovo":
+            winners = np.where(scores > 0, self._pairs[:, 0], self._pairs[:, 1])
+            return self.classes[np.bincount(winners, minlength=len(self.classes)).argmax()]
+
+        if scores.shape[0] == 1:
+            return self.classes[int(scores[0] > 0)]
+        return self.classes[scores.argmax()]
+
+
+def verified_scorer(estimator, x_check: np.ndarray) -> LinearScorer:
+    """
+    Builds the scorer of a fitted estimator and checks that it predicts exactly like it.
+
+    Parameters
+    ----------
+    estimator:
+        A fitted `LogisticRegression` or linear `SVC`.
+    x_check:
+        np.ndarray: Samples used to check that the scorer and the scikit-learn model agree.
+
+    Returns
+    -------
+    LinearScorer: The scorer of the estimator.
+
+    Raises
+    ------
+    ValueError: If the estimator is not supported or the scorer does not match its predictions.
+    """
+    scorer = LinearScorer.from_estimator(estimator)
+
+    if not np.array_equal(scorer.predict(x_check), estimator.predict(x_check)):
+        raise ValueError("The scorer does not match the model predictions")
+
+    return scorer
@@ -0,0 +1,222 @@
+"""Buffered MLflow logger that sends params, metrics and artifacts in batches from a background thread."""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+import mlflow
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+
+from src.config import PROJ_ROOT
+
+# Local file store used when the tracking server fails or is too slow
+FALLBACK_TRACKING_URI = (PROJ_ROOT / "mlruns_fallback").as_uri()
+
+# MLflow does not accept more than 100 params per batch
+MAX_BATCH_SIZE = 100
+
+_CLOSE = object()
+
+
+class AsyncMlflowLogger:
+    """
+    Queues params, metrics and artifacts and logs them to an MLflow run from a background thread.
+
+    The queued entries are sent in batches with `MlflowClient.log_batch`, so the caller never waits for the tracking
+    server. If the server raises an error or does not answer a batch within `slow_threshold` seconds, that batch and
+    the remaining entries are logged to a run in a local file store instead. A batch that timed out may still reach
+    the server later, so it can be logged to both runs. Pending entries are flushed when the logger is closed, either
+    explicitly, when leaving its context or when the interpreter exits.
+
+    Parameters
+    ----------
+    run_id:
+        str | None: The run to log to. If `None`, the active run is used.
+    flush_interval:
+        float: Maximum number of seconds an entry waits in the queue before being sent.
+    slow_threshold:
+        float: Number of seconds after which the tracking server is considered too slow.
+    fallback_tracking_uri:
+        str: Tracking URI of the local file store used as a fallback.
+    """
+
+    def __init__(
+        self,
+        run_id: str | None = None,
+        flush_interval: float = 1.0,
+        slow_threshold: float = 5.0,
+        fallback_tracking_uri: str = FALLBACK_TRACKING_URI,
+    ):
+        active_run = mlflow.active_run()
+        if run_id is None and active_run is None:
+            raise ValueError("There is no active MLflow run: start one with `mlflow.start_run()` or pass `run_id`")
+
+        self.run_id = run_id or active_run.info.run_id
+        self.experiment_id = active_run.info.experiment_id if active_run is not None else None
+        self.flush_interval = flush_interval
+        self.slow_threshold = slow_threshold
+        self.fallback_tracking_uri = fallback_tracking_uri
+
+        self._client = MlflowClient()
+        self._fallback_client = None
+        self._fallback_run_id = None
+        self._use_fallback = False
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="mlflow-logger", daemon=True)
+        self._thread.start()
+
+        # Daemon threads are killed at exit, so make sure the queued entries are sent before
+        atexit.register(self.close)
+
+    def log_params(self, params: dict):
+        """Queues a dictionary of params."""
+        for key, value in params.items():
+            self._queue.put(("param", Param(key, str(value))))
+
+    def log_metrics(self, metrics: dict, step: int | None = None):
+        """Queues a dictionary of metrics, timestamped with the current time."""
+        timestamp = int(time.time() * 1000)
+        for key, value in metrics.items():
+            self._queue.put(("metric", Metric(key, float(value), timestamp, step or 0)))
+
+    def log_artifact(self, local_path: Path, artifact_path: str | None = None):
+        """Queues a local file to be logged as an artifact."""
+        self._queue.put(("artifact", (str(local_path), artifact_path)))
+
+    def flush(self):
+        """Blocks until all the queued entries have been sent."""
+        self._queue.join()
+
+    def close(self):
+        """Sends the queued entries and stops the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        """Background loop that groups the queued entries in batches and sends them."""
+        closing = False
+        while not closing:
+            entries = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            # Wait for more entries until the batch is full or the oldest entry has waited `flush_interval` seconds
+            while entries[-1] is not _CLOSE and len(entries) < MAX_BATCH_SIZE:
+                try:
+                    entries.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if entries[-1] is _CLOSE:
+                closing = True
+                entries.pop()
+
+            try:
+                self._send(entries)
+            finally:
+                for _ in range(len(entries) + closing):
+                    self._queue.task_done()
+
+    def _send(self, entries: list):
+        """Sends a batch of entries to the tracking server, or to the fallback store if the server misbehaves."""
+        if not entries:
+            return
+
+        if not self._use_fallback:
+            try:
+                self._call_with_timeout(self._log_batch, self._client, self.run_id, entries)
+            except TimeoutError:
+                logging.warning("The MLflow tracking server is too slow, falling back to the local store")
+                self._use_fallback = True
+            except Exception:
+                logging.exception("Could not log to the MLflow tracking server, falling back to the local store")
+                self._use_fallback = True
+            else:
+                return
+
+        try:
+            self._log_batch(*self._get_fallback_run(), entries)
+        except Exception:
+            logging.exception("Could not log %d entries to the local MLflow store", len(entries))
+
+    def _get_fallback_run(self) -> tuple[MlflowClient, str]:
+        """Returns the client and run of the fallback store, creating them the first time."""
+        if self._fallback_client is None:
+            self._fallback_client = MlflowClient(tracking_uri=self.fallback_tracking_uri)
+
+            # Use the name of the original experiment, if the tracking server is still able to tell it in time
+            try:
+                experiment_name = self._call_with_timeout(self._client.get_experiment, self.experiment_id).name
+            except Exception:
+                experiment_name = "fallback"
+
+            experiment = self._fallback_client.get_experiment_by_name(experiment_name)
+            if experiment is None:
+                experiment_id = self._fallback_client.create_experiment(experiment_name)
+            else:
+                experiment_id = experiment.experiment_id
+
+            # Keep a reference to the original run so the entries can be matched later
+            self._fallback_run_id = self._fallback_client.create_run(
+                experiment_id, tags={"fallback_for_run_id": self.run_id}
+            ).info.run_id
+
+        return self._fallback_client, self._fallback_run_id
+
+    def _call_with_timeout(self, function, *args):
+        """
+        Calls a function of the tracking client, waiting at most `slow_threshold` seconds for it to return.
+
+        The call runs in a daemon thread, so a hung tracking server can neither block the logger nor the interpreter
+        exit.
+
+        Raises
+        ------
+        TimeoutError: If the call did not return in time.
+        """
+        done = threading.Event()
+        outcome: dict = {}
+
+        def call():
+            try:
+                outcome["result"] = function(*args)
+            except Exception as exc:
+                outcome["error"] = exc
+            finally:
+                done.set()
+
+        threading.Thread(target=call, name="mlflow-logger-call", daemon=True).start()
+
+        if not done.wait(self.slow_threshold):
+            raise TimeoutError(f"The MLflow tracking server did not answer within {self.slow_threshold} seconds")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    @staticmethod
+    def _log_batch(client: MlflowClient, run_id: str, entries: list):
+        """Logs the params and metrics of the entries in a single request, and then their artifacts."""
+        params = [entry for kind, entry in entries if kind == "param"]
+        metrics = [entry for kind, entry in entries if kind == "metric"]
+        artifacts = [entry for kind, entry in entries if kind == "artifact"]
+
+        if params or metrics:
+            client.log_batch(run_id, metrics=metrics, params=params)
+
+        for local_path, artifact_path in artifacts:
+            client.log_artifact(run_id, local_path, artifact_path)
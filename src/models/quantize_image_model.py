@@ -0,0 +1,141 @@
+"""Exports the reduced-precision image models and reports their accuracy versus latency on a local image set."""
+
+import json
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from src.config import EXTERNAL_DATA_DIR, REPORTS_DIR, TEST_DATA_DIR
+from src.features.image_pipeline import dataset_from_bytes
+from src.models.image_models import IMAGE_MODEL_REGISTRY, convert_to_tflite, load_image_model, tflite_model_path
+from src.models.imagenet_labels import decode_top_k, load_imagenet_labels
+
+# Local image set used to compare the models. The class of each image is encoded in its file name, e.g.
+# `n01644373_tree_frog.JPEG`
+IMAGE_SET_DIR = TEST_DATA_DIR
+
+# Unlabelled ImageNet-like JPEG images used to calibrate the activation ranges of the int8 model. If there are none, the
+# model is calibrated on the evaluation images, which biases its accuracy in the report
+CALIBRATION_DIR = EXTERNAL_DATA_DIR / "image_calibration"
+
+# Number of repetitions used to measure the latency of each model
+LATENCY_RUNS = 20
+
+
+def load_images(paths):
+    """Load and preprocess a list of image files.
+
+    Args:
+        paths (list[Path]): The image files.
+
+    Returns:
+        tf.Tensor: The preprocessed images.
+    """
+    dataset = dataset_from_bytes([path.read_bytes() for path in paths], batch_size=len(paths))
+    return next(iter(dataset))
+
+
+def load_image_set():
+    """Load the images of the local image set and their expected class names.
+
+    Returns:
+        Tuple[tf.Tensor, list[str]]: The preprocessed images and their class names.
+    """
+    paths = sorted(IMAGE_SET_DIR.glob("*.JPEG"))
+    class_names = [path.stem[path.stem.find("_") + 1 :] for path in paths]
+
+    return load_images(paths), class_names
+
+
+def load_calibration_images(evaluation_images):
+    """Load the images used to calibrate the int8 model, falling back to the evaluation images.
+
+    Args:
+        evaluation_images (tf.Tensor): The preprocessed images of the local image set.
+
+    Returns:
+        Tuple[tf.Tensor, bool]: The preprocessed calibration images and whether they are the evaluation images.
+    """
+    paths = sorted(CALIBRATION_DIR.glob("*.JPEG")) if CALIBRATION_DIR.exists() else []
+    if not paths:
+        print(f"No calibration images found in {CALIBRATION_DIR}, calibrating on the evaluation images.")
+        return evaluation_images, True
+
+    return load_images(paths), False
+
+
+def benchmark_model(model, images, labels):
+    """Measure the single-image latency of a model and predict the class of each image.
+
+    Args:
+        model: Callable that maps a batch of images to logits.
+        images (tf.Tensor): Preprocessed images.
+        labels (np.ndarray): ImageNet class names.
+
+    Returns:
+        Tuple[list[str], float]: The predicted class names and the mean latency per image in milliseconds.
+    """
+    # Warm up the model so the first call does not distort the latency
+    model(images[:1])
+
+    latencies = []
+    predicted_classes = []
+    for image in images:
+        batch = tf.expand_dims(image, axis=0)
+        for _ in range(LATENCY_RUNS):
+            start = time.perf_counter()
+            predictions = model(batch)
+            latencies.append(time.perf_counter() - start)
+
+        predicted_classes.append(decode_top_k(np.asarray(predictions)[:, 1:], labels, k=1)[0][0][0])
+
+    return predicted_classes, 1000 * float(np.mean(latencies))
+
+
+if __name__ == "__main__":
+    images, expected_classes = load_image_set()
+    calibration_images, calibration_overlaps = load_calibration_images(images)
+    imagenet_labels = load_imagenet_labels()
+
+    # Export the reduced-precision models
+    for model_type, model_info in IMAGE_MODEL_REGISTRY.items():
+        if model_info["precision"] == "float32":
+            continue
+
+        representative_images = tf.data.Dataset.from_tensor_slices(calibration_images).batch(1)
+        tflite_model = convert_to_tflite(model_info["precision"], representative_images)
+
+        model_path = tflite_model_path(model_type)
+        model_path.write_bytes(tflite_model)
+        print(f"Writing file {model_path} to disk.")
+
+    # Compare the accuracy and latency of every model of the registry
+    report = {}
+    reference_classes = None
+    for model_type, model_info in IMAGE_MODEL_REGISTRY.items():
+        predicted_classes, latency = benchmark_model(load_image_model(model_type), images, imagenet_labels)
+
+        if model_info["precision"] == "float32":
+            reference_classes = predicted_classes
+            size = None
+        else:
+            size = tflite_model_path(model_type).stat().st_size / 2**20
+
+        report[model_type] = {
+            "precision": model_info["precision"],
+            "accuracy": float(np.mean(np.array(predicted_classes) == np.array(expected_classes))),
+            "agreement_with_float32": float(np.mean(np.array(predicted_classes) == np.array(reference_classes))),
+            "latency_ms": latency,
+            "size_mb": size,
+        }
+        if model_info["precision"] == "int8":
+            report[model_type]["calibration_images"] = int(calibration_images.shape[0])
+            # If the int8 model was calibrated on the evaluation images, its accuracy and agreement are optimistic
+            report[model_type]["calibrated_on_evaluation_images"] = calibration_overlaps
+
+    REPORTS_DIR.mkdir(exist_ok=True)
+    with open(REPORTS_DIR / "image_quantization.json", "w") as report_file:
+        json.dump(report, report_file, indent=4)
+
+    print(json.dumps(report, indent=4))
@@ -9,20 +9,32 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.tree import DecisionTreeRegressor
 
 from src.config import METRICS_DIR, MODELS_DIR, PROCESSED_DATA_DIR
+from src.features.dtypes import read_csv
+from src.models.mlflow_logger import AsyncMlflowLogger
+from src.profiling import StageProfiler
 
 mlflow.set_experiment("iowa-house-prices")
-mlflow.sklearn.autolog(log_model_signatures=False, log_datasets=False)
 
-with mlflow.start_run():
+# Let MLflow log the autologged params and metrics from a background thread instead of blocking the training. Async
+# logging does not cover `log_model`, which autolog would run inside `fit()` (inferring the pip requirements), so the
+# model is not autologged: the pickled model is logged as an artifact through `mlflow_logger` instead
+mlflow.config.enable_async_logging(True)
+mlflow.sklearn.autolog(log_models=False, log_model_signatures=False, log_datasets=False)
+
+with mlflow.start_run(), AsyncMlflowLogger() as mlflow_logger:
     # Path of the parameters file
     params_path = Path("params.yaml")
 
+    # Profile the steps of the stage if `profile.enabled` is set
+    profiler = StageProfiler.from_params("train", params_path)
+
     # Path of the prepared data folder
     input_folder_path = PROCESSED_DATA_DIR / "iowa_dataset"
 
-    # Read training dataset
-    X_train = pd.read_csv(input_folder_path / "X_train.csv")
-    y_train = pd.read_csv(input_folder_path / "y_train.csv")
+    # Read training dataset with the compact dtypes of the schema
+    with profiler.step("read_csv"):
+        X_train = read_csv(input_folder_path / "X_train.csv")
+        y_train = read_csv(input_folder_path / "y_train.csv")
 
     # Read data preparation parameters
     with open(params_path, encoding="utf8") as params_file:
@@ -45,29 +57,39 @@ with mlflow.start_run():
     # For the sake of reproducibility, set the `random_state`
     iowa_model = algorithm(random_state=params["random_state"])
 
-    # Track the CO2 emissions of training the model
+    # Track the CO2 emissions of fitting the model to the training data. The contexts are entered in order, so the
+    # `emissions_tracker` step includes the `fit` step, and their difference is the overhead of codecarbon (startup,
+    # power sampling and CSV write)
     emissions_output_folder = METRICS_DIR
-    with EmissionsTracker(
-        project_name="iowa-house-prices",
-        measure_power_secs=1,
-        tracking_mode="process",
-        output_dir=emissions_output_folder,
-        output_file="emissions.csv",
-        on_csv_write="append",
-        default_cpu_power=45,
+    with (
+        profiler.step("emissions_tracker"),
+        EmissionsTracker(
+            project_name="iowa-house-prices",
+            measure_power_secs=1,
+            tracking_mode="process",
+            output_dir=emissions_output_folder,
+            output_file="emissions.csv",
+            on_csv_write="append",
+            default_cpu_power=45,
+        ),
+        profiler.step("fit"),
     ):
-        # Then fit the model to the training data
         iowa_model.fit(X_train, y_train)
 
     # Log the CO2 emissions to MLflow
-    emissions = pd.read_csv(emissions_output_folder / "emissions.csv")
-    emissions_metrics = emissions.iloc[-1, 4:13].to_dict()
-    emissions_params = emissions.iloc[-1, 13:].to_dict()
-    mlflow.log_params(emissions_params)
-    mlflow.log_metrics(emissions_metrics)
+    with profiler.step("log_emissions"):
+        emissions = pd.read_csv(emissions_output_folder / "emissions.csv")
+        emissions_metrics = emissions.iloc[-1, 4:13].to_dict()
+        emissions_params = emissions.iloc[-1, 13:].to_dict()
+        mlflow_logger.log_params(emissions_params)
+        mlflow_logger.log_metrics(emissions_metrics)
 
     # Save the model as a pickle file
     Path("models").mkdir(exist_ok=True)
 
-    with open(MODELS_DIR / "iowa_model.pkl", "wb") as pickle_file:
+    with profiler.step("pickle"), open(MODELS_DIR / "iowa_model.pkl", "wb") as pickle_file:
         pickle.dump(iowa_model, pickle_file)
+
+    mlflow_logger.log_artifact(MODELS_DIR / "iowa_model.pkl")
+
+    profiler.save()
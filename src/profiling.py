@@ -0,0 +1,100 @@
+"""Opt-in profiling of the pipeline stages.
+
+Each stage measures the wall time, CPU time and peak RSS of its named steps and stores them in its own section of
+`metrics/profile.json`, so `dvc metrics diff` shows the performance changes between commits. Profiling is enabled with
+the `profile.enabled` parameter in `params.yaml`.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import yaml
+
+from src.config import METRICS_DIR
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_FILE = METRICS_DIR / "profile.json"
+
+
+def peak_rss_mb() -> float | None:
+    """Return the peak resident set size of the process so far, in MB, or `None` if it is not available."""
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, while macOS reports bytes
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+class StageProfiler:
+    """
+    Records the wall time, CPU time and peak RSS of the steps of a pipeline stage.
+
+    Parameters
+    ----------
+    stage:
+        str: The name of the stage.
+    enabled:
+        bool: Whether to profile the stage. If `False`, the profiler does nothing.
+    """
+
+    def __init__(self, stage: str, enabled: bool = True):
+        self.stage = stage
+        self.enabled = enabled
+        self.steps: dict[str, dict] = {}
+
+    @classmethod
+    def from_params(cls, stage: str, params_path: Path = Path("params.yaml")) -> "StageProfiler":
+        """Create a profiler that is enabled according to the `profile.enabled` parameter."""
+        with open(params_path, encoding="utf8") as params_file:
+            params = yaml.safe_load(params_file)
+
+        return cls(stage, enabled=params.get("profile", {}).get("enabled", False))
+
+    @contextmanager
+    def step(self, name: str):
+        """Profile the code run inside the context as the step `name`."""
+        if not self.enabled:
+            yield
+            return
+
+        start_rss = peak_rss_mb()
+        start_cpu = time.process_time()
+        start_wall = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            end_rss = peak_rss_mb()
+            self.steps[name] = {
+                "wall_time_s": time.perf_counter() - start_wall,
+                "cpu_time_s": time.process_time() - start_cpu,
+                "peak_rss_mb": end_rss,
+                # How much the step raised the peak memory of the process
+                "peak_rss_increase_mb": None if end_rss is None else end_rss - start_rss,
+            }
+
+    def save(self, profile_file: Path = PROFILE_FILE):
+        """Write the profile of the stage to its section of the profile file, keeping the ones of the other stages."""
+        if not self.enabled:
+            return
+
+        profile = {}
+        if profile_file.exists():
+            with open(profile_file) as file:
+                profile = json.load(file)
+
+        profile[self.stage] = self.steps
+
+        profile_file.parent.mkdir(exist_ok=True)
+        with open(profile_file, "w") as file:
+            json.dump(profile, file, indent=4)
+
+        print(f"Writing profile of stage {self.stage} to {profile_file}.")
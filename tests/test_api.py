@@ -1,11 +1,14 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 
 import cv2
 import pytest
 from fastapi.testclient import TestClient
 
-from src.app.api import app
-from src.config import TEST_DATA_DIR
+from src.app.api import admission_controller, app, model_wrappers_dict, read_upload
+from src.app.shadow import ShadowEvaluator, parse_shadow_models
+from src.config import MAX_UPLOAD_BYTES, TEST_DATA_DIR
 
 
 def read_image(image_path):
@@ -98,12 +101,82 @@ def test_model_prediction(client, payload):
     assert json["status-code"] == 200
 
 
+@pytest.mark.parametrize("model_type", ["LogisticRegression", "SVC"])
+def test_model_prediction_scorer(client, payload, model_type, monkeypatch):
+    model_wrapper = model_wrappers_dict["tabular"][model_type]
+    assert "scorer" in model_wrapper
+
+    # The prediction must come from the NumPy scorer, not from the scikit-learn model
+    def fail(*args, **kwargs):
+        raise AssertionError("The scikit-learn model was used")
+
+    monkeypatch.setattr(model_wrapper["model"], "predict", fail)
+
+    response = client.post(f"/predict/tabular/{model_type}", json=payload)
+    assert response.status_code == 200
+    assert response.json()["data"]["prediction"] == 2
+
+
+def test_model_prediction_expired_deadline(client, payload):
+    shed_before = client.get("/admission").json()["data"]["tabular"]["shed_deadline"]
+
+    response = client.post("/predict/tabular/LogisticRegression", json=payload, headers={"X-Request-Timeout": "0"})
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    stats = client.get("/admission").json()["data"]["tabular"]
+    assert stats["shed_deadline"] == shed_before + 1
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.parametrize("timeout", ["soon", "nan", "inf", "-inf"])
+def test_model_prediction_invalid_timeout(client, payload, timeout):
+    response = client.post("/predict/tabular/LogisticRegression", json=payload, headers={"X-Request-Timeout": timeout})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
 def test_model_prediction_not_found(client, payload):
     response = client.post("/predict/tabular/RandomForestClassifier", json=payload)
     assert response.status_code == HTTPStatus.BAD_REQUEST
     assert response.json()["detail"] == "Model not found"
 
 
+def test_shadow_stats(client):
+    response = client.get("/shadow/tabular")
+    assert response.status_code == 200
+    assert isinstance(response.json()["data"], dict)
+
+
+def test_shadow_evaluator(client, payload):
+    evaluator = ShadowEvaluator("LogisticRegression", model_wrappers_dict["tabular"]["SVC"], queue_size=4)
+    for _ in range(6):
+        evaluator.submit(list(payload.values()), 2, 0.001)
+
+    # The queue is full and the worker has not started, so the last requests are dropped
+    evaluator.start()
+    evaluator.stop()
+
+    stats = evaluator.stats()
+    assert stats["submitted"] == 4
+    assert stats["dropped"] == 2
+    assert stats["scored"] == 4
+    assert stats["queued"] == 0
+    assert stats["agreement"] == 1.0
+    assert stats["primary_latency_ms"] == pytest.approx(1.0)
+    assert stats["candidate_amortized_latency_ms"] == pytest.approx(
+        stats["candidate_batch_latency_ms"] * stats["batches"] / stats["scored"]
+    )
+
+
+def test_parse_shadow_models():
+    assert parse_shadow_models("") == {}
+    assert parse_shadow_models("LogisticRegression=SVC, SVC=LogisticRegression") == {
+        "LogisticRegression": "SVC",
+        "SVC": "LogisticRegression",
+    }
+    with pytest.raises(ValueError):
+        parse_shadow_models("LogisticRegression")
+
+
 @pytest.mark.parametrize(
     ["sample", "expected"],
     [read_image(image_path) for image_path in TEST_DATA_DIR.glob("*.JPEG")],
@@ -126,3 +199,135 @@ def test_classify_image(client, sample, expected):
     assert json["message"] == "OK"
     assert json["status-code"] == 200
     assert json["data"]["predicted_class"] == expected
+
+
+def test_classify_image_model_not_found(client):
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+    response = client.post(
+        "/predict/image?model_type=resnet50",
+        files={"file": ("image.jpg", cv2.imencode(".jpg", image)[1].tobytes(), "image/jpeg")},
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json()["detail"] == "Model not found"
+
+
+def test_classify_invalid_image(client):
+    response = client.post("/predict/image", files={"file": ("image.jpg", b"not an image", "image/jpeg")})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json()["detail"] == "Invalid image"
+
+
+def test_classify_truncated_image(client):
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+    contents = cv2.imencode(".jpg", image)[1].tobytes()
+
+    # The header is intact, so the image is only rejected when it is decoded
+    truncated = contents[: len(contents) // 2]
+    response = client.post("/predict/image", files={"file": ("image.jpg", truncated, "image/jpeg")})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json()["detail"] == "Invalid image"
+
+
+def test_classify_image_too_many_pixels(client, monkeypatch):
+    monkeypatch.setattr("src.app.api.MAX_IMAGE_PIXELS", 100)
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+
+    response = client.post(
+        "/predict/image", files={"file": ("image.jpg", cv2.imencode(".jpg", image)[1].tobytes(), "image/jpeg")}
+    )
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == "Image larger than 100 pixels"
+
+
+def test_classify_image_too_many_bytes(client):
+    response = client.post("/predict/image", files={"file": ("image.jpg", b"0" * (MAX_UPLOAD_BYTES + 1), "image/jpeg")})
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == f"File larger than {MAX_UPLOAD_BYTES} bytes"
+
+
+def test_classify_image_too_many_bytes_chunked(client):
+    boundary = "image-boundary"
+
+    # A streamed body is sent with chunked encoding, without `Content-Length`
+    def body():
+        yield (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="image.jpg"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n"
+        ).encode()
+        for _ in range(MAX_UPLOAD_BYTES // 2**20 + 2):
+            yield b"0" * 2**20
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/predict/image",
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_classify_image_admitted_after_upload(client, monkeypatch):
+    image_queue = admission_controller.queues["image"]
+    in_flight_while_reading = []
+
+    async def spy_read_upload(file):
+        in_flight_while_reading.append(image_queue.stats()["in_flight"])
+        return await read_upload(file)
+
+    monkeypatch.setattr("src.app.api.read_upload", spy_read_upload)
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+    admitted_before = image_queue.stats()["admitted"]
+
+    response = client.post(
+        "/predict/image", files={"file": ("image.jpg", cv2.imencode(".jpg", image)[1].tobytes(), "image/jpeg")}
+    )
+    assert response.status_code == 200
+
+    # The image slot is only taken for the classification, after the upload has been read
+    assert in_flight_while_reading == [0]
+    assert image_queue.stats()["admitted"] == admitted_before + 1
+    assert image_queue.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize(
+    ["timeout", "status_code"], [("0", HTTPStatus.SERVICE_UNAVAILABLE), ("nan", HTTPStatus.BAD_REQUEST)]
+)
+def test_classify_image_timeout(client, timeout, status_code):
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+    response = client.post(
+        "/predict/image",
+        files={"file": ("image.jpg", cv2.imencode(".jpg", image)[1].tobytes(), "image/jpeg")},
+        headers={"X-Request-Timeout": timeout},
+    )
+    assert response.status_code == status_code
+
+
+def test_tabular_prediction_during_image_classification(client, payload, monkeypatch):
+    model_wrapper = model_wrappers_dict["image"]["mobilenet_v3"]
+    model = model_wrapper["model"]
+    started, release = threading.Event(), threading.Event()
+
+    def slow_model(images):
+        started.set()
+        release.wait(timeout=30)
+        return model(images)
+
+    monkeypatch.setitem(model_wrapper, "model", slow_model)
+    image, _ = read_image(next(TEST_DATA_DIR.glob("*.JPEG")))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        image_response = executor.submit(
+            client.post,
+            "/predict/image",
+            files={"file": ("image.jpg", cv2.imencode(".jpg", image)[1].tobytes(), "image/jpeg")},
+            timeout=60,
+        )
+        assert started.wait(timeout=30)
+
+        # The image is being classified, which must not block the event loop
+        response = client.post("/predict/tabular/LogisticRegression", json=payload)
+        assert response.status_code == 200
+        assert not image_response.done()
+
+        release.set()
+        assert image_response.result().status_code == 200
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import SimpleImputer
+
+from src.config import TEST_DATA_DIR
+from src.features.deepchecks_validation import load_image_properties
+from src.features.dtypes import compact, infer_schema
+from src.features.incremental import load_partition, merge_partitions, partition_key, process_partition, prune_cache
+
+
+@pytest.fixture
+def params():
+    return {"train_size": 0.8, "test_size": 0.2, "random_state": 2023, "partition_size": 10}
+
+
+@pytest.fixture
+def raw_data():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(
+        {
+            "LotArea": rng.integers(1000, 20000, size=30).astype(float),
+            "LotFrontage": rng.normal(70, 10, size=30),
+            "Street": rng.choice(["Pave", "Grvl"], size=30),
+            "SalePrice": rng.integers(50000, 500000, size=30),
+        },
+        index=pd.RangeIndex(1, 31, name="Id"),
+    )
+    data.loc[[3, 12, 25], "LotFrontage"] = np.nan
+    return data
+
+
+def test_merge_partitions_matches_simple_imputer(raw_data, params):
+    results = [process_partition(raw_data.iloc[i : i + 10], params) for i in range(0, 30, 10)]
+    X_train, X_valid, y_train, y_valid = merge_partitions(results)
+
+    raw_X_train = pd.concat([result["X_train"] for result in results])
+    raw_X_valid = pd.concat([result["X_valid"] for result in results])
+    imputer = SimpleImputer().fit(raw_X_train)
+
+    assert list(X_train.columns) == ["LotArea", "LotFrontage"]
+    np.testing.assert_allclose(X_train, imputer.transform(raw_X_train))
+    np.testing.assert_allclose(X_valid, imputer.transform(raw_X_valid))
+    assert len(y_train) + len(y_valid) == len(raw_data)
+
+
+def test_split_does_not_depend_on_partitions(raw_data, params):
+    whole = process_partition(raw_data, params)
+    partitions = [process_partition(raw_data.iloc[i : i + 7], params) for i in range(0, 30, 7)]
+
+    # Appending rows re-processes the last partition, which must not move its rows between train and validation
+    for split in ("X_train", "X_valid"):
+        partition_ids = [row_id for result in partitions for row_id in result[split].index]
+        assert sorted(partition_ids) == sorted(whole[split].index)
+
+
+def test_load_partition_reuses_cache(raw_data, params, tmp_path):
+    _, cached = load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    assert not cached
+
+    # Appending rows creates a new partition, while the previous one is read from the cache
+    _, cached = load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    assert cached
+    _, cached = load_partition(raw_data.iloc[10:20], params, cache_dir=tmp_path)
+    assert not cached
+
+
+def test_load_partition_recovers_from_truncated_cache(raw_data, params, tmp_path):
+    result, _ = load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    (cache_path,) = tmp_path.glob("*.pkl")
+
+    # An entry truncated by an interrupted run is treated as a cache miss, and written again
+    cache_path.write_bytes(cache_path.read_bytes()[:10])
+    reloaded, cached = load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    assert not cached
+    pd.testing.assert_frame_equal(reloaded["X_train"], result["X_train"])
+    assert list(tmp_path.iterdir()) == [cache_path]
+
+    _, cached = load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    assert cached
+
+
+def test_prune_cache(raw_data, params, tmp_path):
+    # The last partition was partial in the previous run, and got new rows since then
+    load_partition(raw_data.iloc[:5], params, cache_dir=tmp_path)
+    load_partition(raw_data.iloc[:10], params, cache_dir=tmp_path)
+    (tmp_path / "interrupted.tmp").write_bytes(b"")
+
+    key = partition_key(raw_data.iloc[:10], params)
+    assert prune_cache({key}, cache_dir=tmp_path) == 2
+    assert list(tmp_path.iterdir()) == [tmp_path / f"{key}.pkl"]
+
+
+def test_infer_schema():
+    x_train = pd.DataFrame({"MSSubClass": [20.0, 60.0], "LotArea": [8450.0, 215245.0], "LotFrontage": [65.0, 70.05]})
+    x_valid = pd.DataFrame({"MSSubClass": [190.0], "LotArea": [9600.0], "LotFrontage": [80.0]})
+
+    schema = infer_schema(x_train, x_valid)
+
+    assert schema == {"MSSubClass": "int16", "LotArea": "int32", "LotFrontage": "float32"}
+    assert compact(x_valid, schema).dtypes.astype(str).to_dict() == schema
+
+
+def test_load_image_properties_recovers_from_truncated_cache(tmp_path):
+    image_path = next(TEST_DATA_DIR.glob("*.JPEG"))
+
+    image_digest, properties = load_image_properties(image_path, cache_dir=tmp_path)
+    (cache_path,) = tmp_path.glob("*.npz")
+
+    # An entry truncated by an interrupted run is treated as a cache miss
+    cache_path.write_bytes(cache_path.read_bytes()[:10])
+    cached_digest, cached_properties = load_image_properties(image_path, cache_dir=tmp_path)
+
+    assert cached_digest == image_digest
+    np.testing.assert_array_equal(cached_properties, properties)
+    assert list(tmp_path.iterdir()) == [cache_path]
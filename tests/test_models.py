@@ -1,10 +1,23 @@
+import json
 import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 
+import numpy as np
 import pytest
+import tensorflow as tf
+from sklearn.datasets import load_iris
 from sklearn.metrics import mean_absolute_error, mean_squared_error
+from sklearn.svm import SVC
 
-from src.config import MODELS_DIR, PROCESSED_DATA_DIR
+from src.config import MODELS_DIR, PROCESSED_DATA_DIR, TEST_DATA_DIR
+from src.models import mlflow_logger
 from src.models.evaluate import load_validation_data
+from src.models.image_models import TFLiteImageModel
+from src.models.imagenet_labels import LABELS_PATH, decode_top_k, load_imagenet_labels, top_k
+from src.models.linear_scorer import LinearScorer
+from src.models.mlflow_logger import AsyncMlflowLogger
 
 
 @pytest.fixture
@@ -36,6 +49,30 @@ def test_iris_lr_model(lr_model, sample, expected):
     assert lr_model.predict(sample) == expected
 
 
+@pytest.mark.parametrize("model_type", ["LogisticRegression", "SVC"])
+def test_iris_linear_scorer(model_type):
+    with open(MODELS_DIR / f"iris_{model_type}_model.pkl", "rb") as f:
+        model = pickle.load(f)["model"]
+    scorer = LinearScorer.from_estimator(model)
+    x = load_iris().data
+
+    np.testing.assert_array_equal(scorer.predict(x), model.predict(x))
+    assert [scorer.predict_one(sample) for sample in x] == list(model.predict(x))
+
+
+def test_binary_svc_linear_scorer():
+    iris_data = load_iris()
+    # Versicolor and virginica, which are not linearly separable, so both classes are predicted
+    mask = iris_data.target > 0
+    x, y = iris_data.data[mask], iris_data.target[mask]
+    model = SVC(kernel="linear", random_state=0).fit(x, y)
+
+    scorer = LinearScorer.from_estimator(model)
+
+    np.testing.assert_array_equal(scorer.predict(x), model.predict(x))
+    assert [scorer.predict_one(sample) for sample in x] == list(model.predict(x))
+
+
 def test_iowa_model(iowa_model, iowa_validation_data):
     x, y = iowa_validation_data
 
@@ -44,3 +81,150 @@ def test_iowa_model(iowa_model, iowa_validation_data):
     # Compute the MAE and MSE values for the model
     assert mean_absolute_error(y, val_predictions) == pytest.approx(0.0, rel=0.1)
     assert mean_squared_error(y, val_predictions) == pytest.approx(0.0, rel=0.1)
+
+
+def test_top_k():
+    scores = np.random.default_rng(0).random((4, 1000))
+
+    indices, top_scores = top_k(scores, k=5)
+
+    np.testing.assert_array_equal(indices, np.argsort(-scores, axis=1)[:, :5])
+    np.testing.assert_array_equal(top_scores, -np.sort(-scores, axis=1)[:, :5])
+
+
+def test_decode_top_k():
+    labels = np.array(["tench", "goldfish", "great_white_shark"])
+    scores = [[0.1, 0.7, 0.2], [0.5, 0.2, 0.3]]
+
+    assert decode_top_k(scores, labels, k=2) == [
+        [("goldfish", 0.7), ("great_white_shark", 0.2)],
+        [("tench", 0.5), ("great_white_shark", 0.3)],
+    ]
+
+
+def test_imagenet_labels():
+    labels = load_imagenet_labels()
+    with open(LABELS_PATH) as labels_file:
+        wordnet_ids = [wordnet_id for wordnet_id, _ in json.load(labels_file)]
+
+    # The test images are named after their WordNet id and class name
+    for image_path in TEST_DATA_DIR.glob("*.JPEG"):
+        wordnet_id, name = image_path.stem.split("_", 1)
+        assert labels[wordnet_ids.index(wordnet_id)] == name
+
+
+def test_imagenet_labels_missing(tmp_path):
+    with pytest.raises(FileNotFoundError, match="python -m src.models.imagenet_labels"):
+        load_imagenet_labels(tmp_path / "imagenet_labels.json")
+
+
+def test_tflite_image_model(tmp_path):
+    keras_model = tf.keras.Sequential(
+        [tf.keras.Input((8, 8, 3)), tf.keras.layers.GlobalAveragePooling2D(), tf.keras.layers.Dense(4)]
+    )
+    model_path = tmp_path / "model.tflite"
+    model_path.write_bytes(tf.lite.TFLiteConverter.from_keras_model(keras_model).convert())
+    model = TFLiteImageModel(model_path)
+
+    images = np.random.default_rng(0).random((3, 8, 8, 3), dtype=np.float32)
+
+    # The input is resized to the batch size of each call
+    for batch in (images[:1], images, images[:2]):
+        np.testing.assert_allclose(model(batch), keras_model(batch), rtol=1e-5, atol=1e-5)
+
+    # Concurrent calls with different batch sizes must not use the interpreter at the same time
+    batches = [images[: i % 3 + 1] for i in range(12)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        predictions = list(executor.map(model, batches))
+    for batch, prediction in zip(batches, predictions, strict=True):
+        np.testing.assert_allclose(prediction, keras_model(batch), rtol=1e-5, atol=1e-5)
+
+
+class StubMlflowClient:
+    """Records the logged batches, after waiting `delay` seconds and raising `error`, if any."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.batches = []
+
+    def log_batch(self, run_id, metrics, params):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.batches.append((run_id, metrics, params))
+
+    def log_artifact(self, run_id, local_path, artifact_path=None):
+        self.log_batch(run_id, [], [])
+
+    def get_experiment(self, experiment_id):
+        time.sleep(self.delay)
+        return SimpleNamespace(name="iowa")
+
+    def get_experiment_by_name(self, name):
+        return None
+
+    def create_experiment(self, name):
+        return "1"
+
+    def create_run(self, experiment_id, tags):
+        return SimpleNamespace(info=SimpleNamespace(run_id="fallback-run"))
+
+
+@pytest.fixture
+def mlflow_clients(monkeypatch):
+    """Replaces the tracking server and the fallback store of the logger with stubs."""
+
+    def use(server):
+        fallback = StubMlflowClient()
+        monkeypatch.setattr(
+            mlflow_logger, "MlflowClient", lambda tracking_uri=None: server if tracking_uri is None else fallback
+        )
+        return server, fallback
+
+    return use
+
+
+def logged_entries(client):
+    """Returns the names of the params and metrics logged to a stub client."""
+    return sorted(entry.key for _, metrics, params in client.batches for entry in [*metrics, *params])
+
+
+def test_mlflow_logger_batches_entries(mlflow_clients):
+    server, fallback = mlflow_clients(StubMlflowClient())
+
+    with AsyncMlflowLogger(run_id="run", flush_interval=0.5) as logger:
+        logger.log_params({"algorithm": "RandomForest", "random_state": 0})
+        logger.log_metrics({"mae": 1.0, "mse": 2.0})
+
+    assert len(server.batches) == 1
+    assert logged_entries(server) == ["algorithm", "mae", "mse", "random_state"]
+    assert fallback.batches == []
+
+
+@pytest.mark.parametrize(
+    "server",
+    [StubMlflowClient(error=ConnectionError("Server down")), StubMlflowClient(delay=5.0)],
+    ids=["failing", "hung"],
+)
+def test_mlflow_logger_falls_back(mlflow_clients, server):
+    server, fallback = mlflow_clients(server)
+
+    start = time.perf_counter()
+    with AsyncMlflowLogger(run_id="run", flush_interval=0.0, slow_threshold=0.2) as logger:
+        logger.log_metrics({"mae": 1.0})
+        logger.flush()
+        logger.log_metrics({"mse": 2.0})
+
+    # A hung server must not block the exit of the context
+    assert time.perf_counter() - start < 2.0
+    assert server.batches == []
+    assert logged_entries(fallback) == ["mae", "mse"]
+    assert {run_id for run_id, _, _ in fallback.batches} == {"fallback-run"}
+
+
+def test_mlflow_logger_requires_run(mlflow_clients):
+    mlflow_clients(StubMlflowClient())
+
+    with pytest.raises(ValueError, match="no active MLflow run"):
+        AsyncMlflowLogger()